@@ -1,294 +1,794 @@
-import json
-import base64
-import discord
-import aiohttp
-from io import BytesIO
-from collections import defaultdict
-
-from redbot.core import commands, Config
-from redbot.core.bot import Red
-
-from openai import AsyncOpenAI
-
-
-# -----------------------------
-# CONFIG
-# -----------------------------
-MAX_MEMORY_BYTES = 10 * 1024 * 1024  # 10MB memory cap
-
-DEFAULT_MODEL = "gpt-4o"
-DEFAULT_IMAGE_MODEL = "gpt-image-1"
-
-
-# -----------------------------
-# COG
-# -----------------------------
-class AskChatGPT(commands.Cog):
-
-    def __init__(self, bot: Red):
-        self.bot = bot
-
-        self.config = Config.get_conf(
-            self,
-            identifier=1234567890,
-            force_registration=True,
-        )
-
-        self.config.register_global(
-            api_key=None,
-            model=DEFAULT_MODEL,
-            image_model=DEFAULT_IMAGE_MODEL,
-            memory={}
-        )
-
-        self.memory = defaultdict(list)
-
-    # -----------------------------
-    # Helpers
-    # -----------------------------
-    async def _get_client(self):
-        api_key = await self.config.api_key()
-        if not api_key:
-            return None
-        return AsyncOpenAI(api_key=api_key)
-
-    def _scope_id(self, obj):
-        guild = getattr(obj, "guild", None)
-        channel = getattr(obj, "channel", None)
-
-        if guild:
-            return str(guild.id)
-        if channel:
-            return str(channel.id)
-
-        return "unknown"
-
-    async def _load_history(self, scope_id):
-        if scope_id in self.memory:
-            return self.memory[scope_id]
-
-        stored = await self.config.memory()
-        self.memory[scope_id] = stored.get(scope_id, [])
-        return self.memory[scope_id]
-
-    async def _save_history(self, scope_id, history):
-        size = len(json.dumps(history).encode("utf-8"))
-
-        while size > MAX_MEMORY_BYTES and history:
-            history.pop(0)
-            size = len(json.dumps(history).encode("utf-8"))
-
-        self.memory[scope_id] = history
-
-        stored = await self.config.memory()
-        stored[scope_id] = history
-        await self.config.memory.set(stored)
-
-    async def send_long_message(self, channel, content):
-        if not content:
-            content = "(empty response)"
-
-        for i in range(0, len(content), 2000):
-            await channel.send(content[i:i + 2000])
-
-    def _format_user_line(self, message, query):
-        if message.guild:
-            sender = f"{message.author.display_name} ({message.author})"
-        else:
-            sender = message.author.display_name
-        return f"{sender}: {query}"
-
-    # ---------- IMPORTANT ----------
-    # Build plain transcript input
-    # (works across OpenAI + proxies)
-    def _build_transcript(self, history_slice):
-        lines = []
-        for msg in history_slice:
-            role = msg.get("role")
-            text = msg.get("content", "")
-
-            if role == "assistant":
-                lines.append(f"Assistant: {text}")
-            else:
-                lines.append(f"User: {text}")
-
-        return "\n".join(lines)
-
-    async def _friendly_error(self, e):
-        s = str(e)
-        model = await self.config.model()
-
-        if "model_not_found" in s:
-            return (
-                f"Model `{model}` not accessible.\n"
-                "Try: `!setmodel gpt-4o`"
-            )
-
-        return f"An error occurred: {s}"
-
-    # -----------------------------
-    # Commands
-    # -----------------------------
-    @commands.command()
-    async def setapikey(self, ctx, *, key: str):
-        await self.config.api_key.set(key.strip())
-        await ctx.send("API key updated.")
-
-    @commands.command()
-    async def setmodel(self, ctx, *, model: str):
-        model = model.lower().strip()
-        await self.config.model.set(model)
-        await ctx.send(f"Model updated to `{model}`.")
-
-    @commands.command()
-    async def setimagemodel(self, ctx, *, model: str):
-        model = model.lower().strip()
-        await self.config.image_model.set(model)
-        await ctx.send(f"Image model updated to `{model}`.")
-
-    @commands.command()
-    async def modelstatus(self, ctx):
-        t = await self.config.model()
-        i = await self.config.image_model()
-        await ctx.send(f"Text model: `{t}`\nImage model: `{i}`")
-
-    @commands.command()
-    async def clearmemory(self, ctx):
-        sid = self._scope_id(ctx)
-        self.memory.pop(sid, None)
-
-        stored = await self.config.memory()
-        stored.pop(sid, None)
-        await self.config.memory.set(stored)
-
-        await ctx.send("Memory cleared.")
-
-    @commands.command()
-    async def memoryusage(self, ctx):
-        sid = self._scope_id(ctx)
-        history = await self._load_history(sid)
-
-        size = len(json.dumps(history).encode("utf-8"))
-        await ctx.send(f"Memory usage: {size/1024/1024:.2f} MB")
-
-    # -----------------------------
-    # Image Generation
-    # -----------------------------
-    @commands.command()
-    async def generateimage(self, ctx, *, description: str):
-
-        client = await self._get_client()
-        if not client:
-            await ctx.send("Set API key first with `!setapikey`.")
-            return
-
-        model = await self.config.image_model()
-
-        try:
-            async with ctx.typing():
-
-                resp = await client.images.generate(
-                    model=model,
-                    prompt=description,
-                    size="1024x1024",
-                    n=1,
-                )
-
-                item = resp.data[0]
-
-                image_data = None
-
-                # URL response
-                image_url = getattr(item, "url", None)
-                if isinstance(image_url, str):
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(image_url) as r:
-                            image_data = await r.read()
-
-                # Base64 fallback
-                if image_data is None:
-                    b64 = getattr(item, "b64_json", None)
-                    if isinstance(b64, str):
-                        image_data = base64.b64decode(b64)
-
-                if image_data is None:
-                    await ctx.send(
-                        f"No image returned. Try `!setimagemodel gpt-image-1`."
-                    )
-                    return
-
-                fp = BytesIO(image_data)
-                fp.seek(0)
-
-                await ctx.send(file=discord.File(fp, "generated.png"))
-
-        except Exception as e:
-            await ctx.send(await self._friendly_error(e))
-
-    # -----------------------------
-    # Mention Listener
-    # -----------------------------
-    @commands.Cog.listener("on_message")
-    async def on_mention(self, message: discord.Message):
-
-        if message.author.bot:
-            return
-        if not self.bot.user:
-            return
-        if self.bot.user not in message.mentions:
-            return
-
-        content = message.content.replace(f"<@!{self.bot.user.id}>", "")
-        content = content.replace(f"<@{self.bot.user.id}>", "")
-        content = content.strip()
-
-        if not content:
-            await message.channel.send("Say something after mentioning me 🙂")
-            return
-
-        await self.handle_askgpt(message, content)
-
-    # -----------------------------
-    # Chat Handler
-    # -----------------------------
-    async def handle_askgpt(self, message, query):
-
-        client = await self._get_client()
-        if not client:
-            await message.channel.send("Set API key first.")
-            return
-
-        model = await self.config.model()
-
-        sid = self._scope_id(message)
-        history = await self._load_history(sid)
-
-        formatted = self._format_user_line(message, query)
-        history.append({"role": "user", "content": formatted})
-
-        try:
-            async with message.channel.typing():
-
-                transcript = self._build_transcript(history[-10:])
-
-                resp = await client.responses.create(
-                    model=model,
-                    input=transcript,
-                    max_output_tokens=1024,
-                )
-
-                reply = (getattr(resp, "output_text", "") or "").strip()
-                if not reply:
-                    reply = "(No response text returned.)"
-
-                history.append({"role": "assistant", "content": reply})
-
-                await self._save_history(sid, history)
-                await self.send_long_message(message.channel, reply)
-
-        except Exception as e:
-            await message.channel.send(await self._friendly_error(e))
-
-
-async def setup(bot: Red):
-    await bot.add_cog(AskChatGPT(bot))
+import asyncio
+import base64
+import logging
+import discord
+import aiohttp
+import httpx
+from contextlib import nullcontext
+from io import BytesIO
+
+from redbot.core import commands, Config
+from redbot.core.bot import Red
+from redbot.core.data_manager import cog_data_path
+
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from .cache import ImageStore, ResponseCache, make_key, normalize
+from .context import estimate_tokens, fit_newest, load_encoding, pack_window
+from .delivery import MESSAGE_LIMIT, deliver
+from .history import HistoryStore
+from .ratelimit import LANE_CHAT, LANE_IMAGE, RateLimiter
+
+
+log = logging.getLogger("red.dylanpatrick.askchatgpt")
+
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+MAX_MEMORY_BYTES = 10 * 1024 * 1024  # 10MB memory cap
+HISTORY_FLUSH_INTERVAL = 30  # seconds between write-behind flushes
+HISTORY_FLUSH_THRESHOLD = 25  # dirty scopes that trigger an early flush
+HISTORY_CACHE_BUDGET = 256 * 1024 * 1024  # resident history across all scopes
+
+HTTP_POOL_LIMIT = 20  # max pooled connections per client/session
+HTTP_KEEPALIVE = 60  # seconds an idle pooled connection is kept open
+
+STREAM_EDIT_INTERVAL = 1.2  # seconds between edits (Discord allows 5 per 5s)
+
+ATTACH_THRESHOLD = 12000  # replies longer than this are sent as a file
+
+MAX_CONCURRENCY = 4  # chat requests in flight across all scopes
+
+CONTEXT_TOKEN_BUDGET = 3000  # estimated input tokens of recent turns per call
+SUMMARY_REFRESH_TURNS = 6  # unsummarized older turns before re-summarizing
+SUMMARY_INPUT_TOKENS = 6000  # cap on older turns folded in one refresh
+SUMMARY_MAX_TOKENS = 300
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below for your own future reference. "
+    "Keep names, facts, decisions and open questions. Be concise."
+)
+
+REPLY_CACHE_SIZE = 1000  # cached chat replies
+IMAGE_CACHE_SIZE = 200  # cached images kept on disk
+CACHE_TTL = 60 * 60  # seconds
+
+RATE_LIMIT_RPM = 500  # upstream requests per minute
+RATE_LIMIT_TPM = 30000  # upstream tokens per minute
+MAX_OUTPUT_TOKENS = 1024
+
+DEFAULT_MODEL = "gpt-4o"
+DEFAULT_IMAGE_MODEL = "gpt-image-1"
+IMAGE_SIZE = "1024x1024"
+
+
+# -----------------------------
+# COG
+# -----------------------------
+class AskChatGPT(commands.Cog):
+
+    metrics_timer = staticmethod(lambda family, name: nullcontext())
+
+    def __init__(self, bot: Red):
+        self.bot = bot
+
+        self.config = Config.get_conf(
+            self,
+            identifier=1234567890,
+            force_registration=True,
+        )
+
+        self.config.register_global(
+            api_key=None,
+            model=DEFAULT_MODEL,
+            image_model=DEFAULT_IMAGE_MODEL,
+            memory={},  # legacy single-blob layout, migrated on load
+            history_cache_budget=HISTORY_CACHE_BUDGET,
+            http_pool_limit=HTTP_POOL_LIMIT,
+            stream_replies=False,
+            max_concurrency=MAX_CONCURRENCY,
+            context_tokens=CONTEXT_TOKEN_BUDGET,
+            cache_enabled=False,
+            cache_ttl=CACHE_TTL,
+            rate_limit_rpm=RATE_LIMIT_RPM,
+            rate_limit_tpm=RATE_LIMIT_TPM,
+            attach_threshold=ATTACH_THRESHOLD,
+        )
+
+        self.config.init_custom("HISTORY", 1)
+        self.config.register_custom("HISTORY", entries=[])
+
+        self.history = HistoryStore(
+            self.config,
+            flush_interval=HISTORY_FLUSH_INTERVAL,
+            flush_threshold=HISTORY_FLUSH_THRESHOLD,
+            budget=HISTORY_CACHE_BUDGET,
+            timer=lambda family, name: self.metrics_timer(family, name),
+        )
+
+        # Long-lived, pooled HTTP clients; built lazily, rebuilt on key change.
+        self._client = None
+        self._client_key = None
+        self._session = None
+        self._http_lock = asyncio.Lock()
+
+        # One worker per scope; mentions that arrive while it is busy are
+        # queued here and answered together in a single follow-up call.
+        self._pending = {}
+        self._workers = {}
+        self._slots = asyncio.Semaphore(MAX_CONCURRENCY)
+
+        # Opt-in response caches; generated images live on disk.
+        self.images = ImageStore(cog_data_path(self) / "images")
+        self.reply_cache = ResponseCache(REPLY_CACHE_SIZE, CACHE_TTL)
+        self.image_cache = ResponseCache(
+            IMAGE_CACHE_SIZE, CACHE_TTL, on_evict=self._drop_image
+        )
+
+        # Every upstream call goes through here; retries are done by the
+        # limiter, so the OpenAI client's own retries are turned off.
+        self.limiter = RateLimiter(
+            RATE_LIMIT_RPM,
+            RATE_LIMIT_TPM,
+            timer=lambda family, name: self.metrics_timer(family, name),
+        )
+
+    async def cog_load(self):
+        self.history.set_budget(await self.config.history_cache_budget())
+        ttl = await self.config.cache_ttl()
+        self.reply_cache.ttl = ttl
+        self.image_cache.ttl = ttl
+        self._slots = asyncio.Semaphore(await self.config.max_concurrency())
+        self.limiter.configure(
+            await self.config.rate_limit_rpm(),
+            await self.config.rate_limit_tpm(),
+        )
+        await self.history.migrate()
+        self.history.start()
+        await self.images.purge()
+        # Token counts fall back to a heuristic until this finishes.
+        self._encoding_task = asyncio.create_task(load_encoding())
+
+    async def cog_unload(self):
+        self._encoding_task.cancel()
+        for task in self._workers.values():
+            task.cancel()
+        self.limiter.close()
+        await self.history.close()
+        await self._close_http()
+
+    # -----------------------------
+    # Helpers
+    # -----------------------------
+    async def _get_client(self):
+        api_key = await self.config.api_key()
+        if not api_key:
+            return None
+
+        if self._client is not None and self._client_key == api_key:
+            return self._client
+
+        async with self._http_lock:
+            if self._client is None or self._client_key != api_key:
+                await self._close_client()
+
+                limit = await self.config.http_pool_limit()
+                http_client = DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=limit,
+                        max_keepalive_connections=limit,
+                        keepalive_expiry=HTTP_KEEPALIVE,
+                    )
+                )
+                self._client = AsyncOpenAI(
+                    api_key=api_key,
+                    http_client=http_client,
+                    max_retries=0,
+                )
+                self._client_key = api_key
+
+            return self._client
+
+    async def _get_session(self):
+        if self._session is not None and not self._session.closed:
+            return self._session
+
+        async with self._http_lock:
+            if self._session is None or self._session.closed:
+                limit = await self.config.http_pool_limit()
+                connector = aiohttp.TCPConnector(
+                    limit=limit,
+                    keepalive_timeout=HTTP_KEEPALIVE,
+                )
+                self._session = aiohttp.ClientSession(connector=connector)
+
+            return self._session
+
+    async def _close_client(self):
+        client, self._client = self._client, None
+        self._client_key = None
+        if client is not None:
+            await client.close()
+
+    async def _close_http(self):
+        await self._close_client()
+
+        session, self._session = self._session, None
+        if session is not None:
+            await session.close()
+
+    def _drop_image(self, key, digest):
+        # Several prompts can resolve to identical bytes.
+        if digest not in self.image_cache.values():
+            self.images.remove(digest)
+
+    def _scope_id(self, obj):
+        guild = getattr(obj, "guild", None)
+        channel = getattr(obj, "channel", None)
+
+        if guild:
+            return str(guild.id)
+        if channel:
+            return str(channel.id)
+
+        return "unknown"
+
+    async def _load_history(self, scope_id):
+        return await self.history.load(scope_id)
+
+    async def _save_history(self, scope_id, history):
+        history.trim(MAX_MEMORY_BYTES)
+        self.history.save(scope_id, history)
+
+    async def send_long_message(self, channel, content, header=""):
+        if not content:
+            content = "(empty response)"
+
+        use_embeds = True
+        guild = getattr(channel, "guild", None)
+        if guild is not None:
+            use_embeds = channel.permissions_for(guild.me).embed_links
+
+        colour = await self.bot.get_embed_colour(channel)
+        attach_over = await self.config.attach_threshold()
+        with self.metrics_timer("outbound", "askchatgpt.deliver"):
+            await deliver(
+                channel,
+                content,
+                header=header,
+                use_embeds=use_embeds,
+                colour=colour,
+                attach_over=attach_over,
+            )
+
+    async def _stream_reply(self, channel, client, model, transcript, header=""):
+        # Show text as it arrives: the first delta is sent right away, then
+        # the message is edited at most once per STREAM_EDIT_INTERVAL.
+        # Full messages are finalized and a new one started at MESSAGE_LIMIT.
+        loop = asyncio.get_running_loop()
+
+        stream = await self.limiter.call(
+            lambda: client.responses.create(
+                model=model,
+                input=transcript,
+                max_output_tokens=MAX_OUTPUT_TOKENS,
+                stream=True,
+            ),
+            tokens=estimate_tokens(transcript) + MAX_OUTPUT_TOKENS,
+            lane=LANE_CHAT,
+        )
+
+        parts = []
+        current = header
+        shown = 0
+        placeholder = None
+        last_edit = 0.0
+
+        async for event in stream:
+            if event.type != "response.output_text.delta":
+                continue
+
+            parts.append(event.delta)
+            current += event.delta
+
+            while len(current) > MESSAGE_LIMIT:
+                head, current = current[:MESSAGE_LIMIT], current[MESSAGE_LIMIT:]
+                if placeholder is None:
+                    await channel.send(head)
+                else:
+                    await placeholder.edit(content=head)
+                placeholder = None
+                shown = 0
+
+            if not current.strip():
+                continue
+
+            now = loop.time()
+            if placeholder is None:
+                placeholder = await channel.send(current)
+                shown = len(current)
+                last_edit = now
+            elif shown != len(current) and now - last_edit >= STREAM_EDIT_INTERVAL:
+                await placeholder.edit(content=current)
+                shown = len(current)
+                last_edit = now
+
+        reply = "".join(parts).strip()
+        if not reply:
+            await channel.send(header + "(No response text returned.)")
+        elif current.strip():
+            if placeholder is None:
+                await channel.send(current)
+            elif shown != len(current):
+                await placeholder.edit(content=current)
+
+        return reply
+
+    def _enqueue(self, message, query):
+        sid = self._scope_id(message)
+        self._pending.setdefault(sid, []).append((message, query))
+
+        if sid not in self._workers:
+            self._workers[sid] = asyncio.create_task(self._scope_worker(sid))
+
+    async def _scope_worker(self, sid):
+        try:
+            while self._pending.get(sid):
+                batch = self._pending.pop(sid)
+                try:
+                    async with self._slots:
+                        with self.metrics_timer("listener", "askchatgpt.handle_askgpt"):
+                            await self.handle_askgpt(batch)
+                except Exception:
+                    # Keep draining the queue; later mentions may still succeed.
+                    log.exception("Failed to answer %d message(s) in scope %s.", len(batch), sid)
+        finally:
+            self._workers.pop(sid, None)
+
+    def _reply_header(self, batch):
+        # Coalesced replies mention everyone they answer.
+        authors = {}
+        for message, _ in batch:
+            authors.setdefault(message.author.id, message.author)
+
+        if len(authors) < 2:
+            return ""
+        return " ".join(a.mention for a in authors.values()) + "\n"
+
+    def _format_user_line(self, message, query):
+        if message.guild:
+            sender = f"{message.author.display_name} ({message.author})"
+        else:
+            sender = message.author.display_name
+        return f"{sender}: {query}"
+
+    # ---------- IMPORTANT ----------
+    # Build plain transcript input
+    # (works across OpenAI + proxies)
+    def _build_transcript(self, history_slice, summary=None):
+        lines = []
+        if summary:
+            lines.append(f"Summary of earlier conversation: {summary}")
+
+        for msg in history_slice:
+            role = msg.get("role")
+            text = msg.get("content", "")
+
+            if role == "assistant":
+                lines.append(f"Assistant: {text}")
+            else:
+                lines.append(f"User: {text}")
+
+        return "\n".join(lines)
+
+    async def _build_context(self, client, model, history, minimum):
+        # Recent turns up to the token budget, plus a rolling summary of
+        # older ones. The summary is only rebuilt once enough turns have
+        # fallen out of the window since it was last computed.
+        budget = await self.config.context_tokens()
+        start = pack_window(history, budget, minimum)
+
+        summary = history.summary
+        covered = summary[0] if summary else history.dropped
+        if start - covered >= SUMMARY_REFRESH_TURNS:
+            summary = await self._refresh_summary(client, model, history, start) or summary
+
+        text = summary[1] if summary else None
+        return self._build_transcript(history.slice(start, history.end), text)
+
+    async def _refresh_summary(self, client, model, history, start):
+        previous = history.summary
+        covered = previous[0] if previous else history.dropped
+        folded = fit_newest(history.slice(covered, start), SUMMARY_INPUT_TOKENS)
+
+        parts = [SUMMARY_PROMPT]
+        if previous:
+            parts.append(f"Earlier summary: {previous[1]}")
+        parts.append(self._build_transcript(folded))
+
+        prompt = "\n\n".join(parts)
+        try:
+            resp = await self.limiter.call(
+                lambda: client.responses.create(
+                    model=model,
+                    input=prompt,
+                    max_output_tokens=SUMMARY_MAX_TOKENS,
+                ),
+                tokens=estimate_tokens(prompt) + SUMMARY_MAX_TOKENS,
+                lane=LANE_CHAT,
+            )
+        except Exception:
+            log.exception("Failed to refresh conversation summary.")
+            return None
+
+        text = (getattr(resp, "output_text", "") or "").strip()
+        if not text:
+            return None
+
+        history.summary = (start, text)
+        return history.summary
+
+    async def _friendly_error(self, e):
+        s = str(e)
+        model = await self.config.model()
+
+        if "model_not_found" in s:
+            return (
+                f"Model `{model}` not accessible.\n"
+                "Try: `!setmodel gpt-4o`"
+            )
+
+        return f"An error occurred: {s}"
+
+    # -----------------------------
+    # Commands
+    # -----------------------------
+    @commands.command()
+    async def setapikey(self, ctx, *, key: str):
+        key = key.strip()
+        if key != await self.config.api_key():
+            await self.config.api_key.set(key)
+            await self._close_client()
+        await ctx.send("API key updated.")
+
+    @commands.command()
+    @commands.is_owner()
+    async def setpoollimit(self, ctx, limit: int):
+        if limit < 1:
+            await ctx.send("Pool limit must be at least 1.")
+            return
+
+        await self.config.http_pool_limit.set(limit)
+        await self._close_http()
+        await ctx.send(f"HTTP pool limit set to {limit} connections.")
+
+    @commands.command()
+    @commands.is_owner()
+    async def setstreaming(self, ctx, enabled: bool):
+        await self.config.stream_replies.set(enabled)
+        state = "enabled" if enabled else "disabled"
+        await ctx.send(f"Streaming replies {state}.")
+
+    @commands.command()
+    @commands.is_owner()
+    async def setconcurrency(self, ctx, limit: int):
+        if limit < 1:
+            await ctx.send("Concurrency must be at least 1.")
+            return
+
+        await self.config.max_concurrency.set(limit)
+        # Requests already holding a slot finish on the old semaphore.
+        self._slots = asyncio.Semaphore(limit)
+        await ctx.send(f"Up to {limit} chat requests will run at once.")
+
+    @commands.command()
+    @commands.is_owner()
+    async def setcontexttokens(self, ctx, tokens: int):
+        if tokens < 256:
+            await ctx.send("Context budget must be at least 256 tokens.")
+            return
+
+        await self.config.context_tokens.set(tokens)
+        await ctx.send(f"Recent-turn context budget set to {tokens} tokens.")
+
+    @commands.command()
+    @commands.is_owner()
+    async def setcache(self, ctx, enabled: bool, ttl_minutes: int = None):
+        await self.config.cache_enabled.set(enabled)
+
+        if ttl_minutes is not None and ttl_minutes > 0:
+            ttl = ttl_minutes * 60
+            await self.config.cache_ttl.set(ttl)
+            self.reply_cache.ttl = ttl
+            self.image_cache.ttl = ttl
+
+        if not enabled:
+            self.reply_cache.clear()
+            self.image_cache.clear()
+
+        state = "enabled" if enabled else "disabled"
+        ttl = await self.config.cache_ttl()
+        await ctx.send(f"Response cache {state} (TTL {ttl // 60} minutes).")
+
+    @commands.command()
+    @commands.is_owner()
+    async def cachestats(self, ctx):
+        lines = []
+        for name, cache in (("Replies", self.reply_cache), ("Images", self.image_cache)):
+            lookups = cache.hits + cache.shared + cache.misses
+            ratio = (cache.hits + cache.shared) / lookups if lookups else 0.0
+            lines.append(
+                f"{name}: {len(cache)} cached, {cache.hits} hits, "
+                f"{cache.shared} shared in-flight, {cache.misses} misses "
+                f"({ratio:.1%} served without a new call)"
+            )
+        await ctx.send("\n".join(lines))
+
+    @commands.command()
+    @commands.is_owner()
+    async def setratelimit(self, ctx, rpm: int, tpm: int):
+        if rpm < 1 or tpm < 1:
+            await ctx.send("Limits must be at least 1.")
+            return
+
+        await self.config.rate_limit_rpm.set(rpm)
+        await self.config.rate_limit_tpm.set(tpm)
+        self.limiter.configure(rpm, tpm)
+        await ctx.send(f"Upstream limit set to {rpm} requests and {tpm} tokens per minute.")
+
+    @commands.command()
+    @commands.is_owner()
+    async def setattachthreshold(self, ctx, characters: int):
+        if characters < MESSAGE_LIMIT:
+            await ctx.send(f"Threshold must be at least {MESSAGE_LIMIT} characters.")
+            return
+
+        await self.config.attach_threshold.set(characters)
+        await ctx.send(f"Replies over {characters} characters will be sent as a file.")
+
+    @commands.command()
+    async def setmodel(self, ctx, *, model: str):
+        model = model.lower().strip()
+        await self.config.model.set(model)
+        await ctx.send(f"Model updated to `{model}`.")
+
+    @commands.command()
+    async def setimagemodel(self, ctx, *, model: str):
+        model = model.lower().strip()
+        await self.config.image_model.set(model)
+        await ctx.send(f"Image model updated to `{model}`.")
+
+    @commands.command()
+    async def modelstatus(self, ctx):
+        t = await self.config.model()
+        i = await self.config.image_model()
+        await ctx.send(f"Text model: `{t}`\nImage model: `{i}`")
+
+    @commands.command()
+    async def clearmemory(self, ctx):
+        sid = self._scope_id(ctx)
+        await self.history.clear(sid)
+
+        await ctx.send("Memory cleared.")
+
+    @commands.command()
+    async def memoryusage(self, ctx):
+        sid = self._scope_id(ctx)
+        history = await self._load_history(sid)
+
+        size = history.nbytes
+        await ctx.send(f"Memory usage: {size/1024/1024:.2f} MB")
+
+    @commands.command()
+    @commands.is_owner()
+    async def historycache(self, ctx):
+        store = self.history
+        lookups = store.hits + store.misses
+        ratio = store.hits / lookups if lookups else 0.0
+
+        await ctx.send(
+            f"Resident scopes: {len(store.memory)}\n"
+            f"Resident size: {store.resident_bytes/1024/1024:.2f} MB"
+            f" / {store.budget/1024/1024:.0f} MB budget\n"
+            f"Hit ratio: {ratio:.1%} ({store.hits} hits, {store.misses} misses)"
+        )
+
+    @commands.command()
+    @commands.is_owner()
+    async def sethistorybudget(self, ctx, megabytes: int):
+        if megabytes < 1:
+            await ctx.send("Budget must be at least 1 MB.")
+            return
+
+        budget = megabytes * 1024 * 1024
+        await self.config.history_cache_budget.set(budget)
+        self.history.set_budget(budget)
+        await ctx.send(f"History cache budget set to {megabytes} MB.")
+
+    # -----------------------------
+    # Image Generation
+    # -----------------------------
+    @commands.command()
+    async def generateimage(self, ctx, *, description: str):
+
+        client = await self._get_client()
+        if not client:
+            await ctx.send("Set API key first with `!setapikey`.")
+            return
+
+        model = await self.config.image_model()
+
+        try:
+            async with ctx.typing():
+
+                if await self.config.cache_enabled():
+                    key = make_key(model, IMAGE_SIZE, normalize(description))
+
+                    async def produce():
+                        data = await self._generate_image(client, model, description)
+                        if data is None:
+                            return None
+                        return await self.images.put(data)
+
+                    digest = await self.image_cache.fetch(key, produce)
+                    if digest is not None and not self.images.exists(digest):
+                        # File was removed from disk; regenerate it.
+                        self.image_cache.invalidate(key)
+                        digest = await self.image_cache.fetch(key, produce)
+
+                    file = None
+                    if digest is not None:
+                        file = discord.File(str(self.images.path(digest)), "generated.png")
+                else:
+                    image_data = await self._generate_image(client, model, description)
+
+                    file = None
+                    if image_data is not None:
+                        fp = BytesIO(image_data)
+                        fp.seek(0)
+                        file = discord.File(fp, "generated.png")
+
+                if file is None:
+                    await ctx.send(
+                        f"No image returned. Try `!setimagemodel gpt-image-1`."
+                    )
+                    return
+
+                await ctx.send(file=file)
+
+        except Exception as e:
+            await ctx.send(await self._friendly_error(e))
+
+    async def _generate_image(self, client, model, description):
+        resp = await self.limiter.call(
+            lambda: client.images.generate(
+                model=model,
+                prompt=description,
+                size=IMAGE_SIZE,
+                n=1,
+            ),
+            lane=LANE_IMAGE,
+        )
+
+        item = resp.data[0]
+
+        image_data = None
+
+        # URL response
+        image_url = getattr(item, "url", None)
+        if isinstance(image_url, str):
+            session = await self._get_session()
+            async with session.get(image_url) as r:
+                image_data = await r.read()
+
+        # Base64 fallback
+        if image_data is None:
+            b64 = getattr(item, "b64_json", None)
+            if isinstance(b64, str):
+                image_data = base64.b64decode(b64)
+
+        return image_data
+
+    # -----------------------------
+    # Mention Listener
+    # -----------------------------
+    @commands.Cog.listener("on_message")
+    async def on_mention(self, message: discord.Message):
+
+        if message.author.bot:
+            return
+        with self.metrics_timer("listener", "askchatgpt.on_mention"):
+            await self._on_mention(message)
+
+    async def _on_mention(self, message):
+        if not self.bot.user:
+            return
+        if self.bot.user not in message.mentions:
+            return
+
+        content = message.content.replace(f"<@!{self.bot.user.id}>", "")
+        content = content.replace(f"<@{self.bot.user.id}>", "")
+        content = content.strip()
+
+        if not content:
+            await message.channel.send("Say something after mentioning me 🙂")
+            return
+
+        self._enqueue(message, content)
+
+    # -----------------------------
+    # Chat Handler
+    # -----------------------------
+    async def handle_askgpt(self, batch):
+        # `batch` is one or more (message, query) pairs from the same scope.
+        message = batch[-1][0]
+
+        client = await self._get_client()
+        if not client:
+            await message.channel.send("Set API key first.")
+            return
+
+        model = await self.config.model()
+
+        sid = self._scope_id(message)
+        history = await self._load_history(sid)
+
+        for msg, query in batch:
+            formatted = self._format_user_line(msg, query)
+            history.append({"role": "user", "content": formatted})
+
+        header = self._reply_header(batch)
+
+        try:
+            async with message.channel.typing():
+
+                transcript = await self._build_context(
+                    client, model, history, minimum=len(batch)
+                )
+
+                stream = await self.config.stream_replies()
+                streamed = False
+
+                # Cache hits and shared in-flight requests never call this,
+                # so their reply is sent normally even in streaming mode.
+                async def ask():
+                    nonlocal streamed
+                    if stream:
+                        streamed = True
+                        return await self._stream_reply(
+                            message.channel, client, model, transcript, header
+                        )
+
+                    resp = await self.limiter.call(
+                        lambda: client.responses.create(
+                            model=model,
+                            input=transcript,
+                            max_output_tokens=MAX_OUTPUT_TOKENS,
+                        ),
+                        tokens=estimate_tokens(transcript) + MAX_OUTPUT_TOKENS,
+                        lane=LANE_CHAT,
+                    )
+                    return (getattr(resp, "output_text", "") or "").strip()
+
+                if await self.config.cache_enabled():
+                    key = make_key(model, normalize(transcript))
+                    reply = await self.reply_cache.fetch(key, ask)
+                else:
+                    reply = await ask()
+
+                if not reply:
+                    reply = "(No response text returned.)"
+
+                history.append({"role": "assistant", "content": reply})
+
+                await self._save_history(sid, history)
+                if not streamed:
+                    await self.send_long_message(message.channel, reply, header)
+
+        except Exception as e:
+            await message.channel.send(await self._friendly_error(e))
+
+
+async def setup(bot: Red):
+    await bot.add_cog(AskChatGPT(bot))
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import shutil
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+def normalize(text):
+    return " ".join(text.split()).casefold()
+
+
+def make_key(*parts):
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """TTL + LRU cache that also shares identical in-flight requests.
+
+    ``fetch`` returns a cached value when there is a fresh one, joins an
+    identical request that is already running, or runs ``factory`` and
+    caches its result. Empty results (``None``, ``""``) are never cached.
+    """
+
+    def __init__(self, max_entries, ttl, on_evict=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def values(self):
+        return [value for _, value in self._entries.values()]
+
+    def _pop(self, key):
+        _, value = self._entries.pop(key)
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def get(self, key):
+        item = self._entries.get(key)
+        if item is None:
+            return None
+
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            self._pop(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if key in self._entries:
+            self._entries.pop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+        while len(self._entries) > self.max_entries:
+            self._pop(next(iter(self._entries)))
+
+    def invalidate(self, key):
+        if key in self._entries:
+            self._pop(key)
+
+    def clear(self):
+        for key in list(self._entries):
+            self._pop(key)
+
+    async def fetch(self, key, factory):
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.shared += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[key] = pending
+
+        try:
+            value = await factory()
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            # Waiters get the exception; don't warn if there were none.
+            pending.exception()
+            raise
+        else:
+            if value:
+                self.put(key, value)
+            pending.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+
+class ImageStore:
+    """Content-addressed image files under the cog's data folder."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, digest):
+        return self.root / digest[:2] / f"{digest}.png"
+
+    def exists(self, digest):
+        return self.path(digest).is_file()
+
+    def _write(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+    async def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not path.is_file():
+            await asyncio.to_thread(self._write, path, data)
+        return digest
+
+    def remove(self, digest):
+        self.path(digest).unlink(missing_ok=True)
+
+    async def purge(self):
+        # The cache index lives in memory, so files left from a previous
+        # run can never be looked up again.
+        await asyncio.to_thread(shutil.rmtree, self.root, True)
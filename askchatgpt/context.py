@@ -0,0 +1,79 @@
+import asyncio
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+ENTRY_OVERHEAD = 4  # role prefix and newline per transcript line
+ENCODED_CACHE = 4096  # texts whose tiktoken length is remembered
+
+_encoding = None
+
+
+async def load_encoding():
+    """Load the tiktoken encoding in a thread; it may be downloaded on first use.
+
+    Until it is loaded (or if it can't be), counts use the heuristic.
+    """
+    global _encoding
+
+    if tiktoken is None or _encoding is not None:
+        return
+    try:
+        _encoding = await asyncio.to_thread(tiktoken.get_encoding, "o200k_base")
+    except Exception:
+        # Encoding data unavailable (e.g. offline); keep the heuristic.
+        pass
+
+
+@lru_cache(maxsize=ENCODED_CACHE)
+def _encoded_length(text):
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def estimate_tokens(text):
+    """Rough token count, using tiktoken once its encoding is loaded."""
+    if _encoding is not None:
+        return _encoded_length(text)
+    return len(text) // 4 + 1
+
+
+def entry_tokens(entry):
+    return estimate_tokens(entry.get("content", "")) + ENTRY_OVERHEAD
+
+
+def pack_window(history, budget, minimum=1):
+    """Return the absolute index where the newest `budget` tokens begin.
+
+    At least `minimum` entries are always kept, even when they alone
+    exceed the budget.
+    """
+    used = 0
+    start = history.end
+
+    for count, entry in enumerate(reversed(history)):
+        cost = entry_tokens(entry)
+        if count >= minimum and used + cost > budget:
+            break
+        used += cost
+        start -= 1
+
+    return start
+
+
+def fit_newest(entries, budget):
+    """Return the newest of `entries` that fit in `budget` tokens, in order."""
+    used = 0
+    kept = []
+
+    for entry in reversed(entries):
+        used += entry_tokens(entry)
+        if used > budget:
+            break
+        kept.append(entry)
+
+    kept.reverse()
+    return kept
@@ -0,0 +1,179 @@
+from io import BytesIO
+
+import discord
+
+
+MESSAGE_LIMIT = 2000  # characters of plain message content
+EMBED_CHUNK = 3000  # characters per embed description (hard cap 4096)
+EMBED_MESSAGE_LIMIT = 6000  # characters across all embeds of one message
+EMBEDS_PER_MESSAGE = 10
+
+
+def _is_fence(line):
+    return line.lstrip().startswith(("```", "~~~"))
+
+
+def _blocks(text):
+    """Split `text` into lists of lines that are kept together if possible.
+
+    Code blocks (fence to fence) are one block; prose is split after each
+    blank line. Joining every line of every block with "\\n" gives back
+    the original text.
+    """
+    blocks = []
+    current = []
+    fence = None
+
+    for line in text.split("\n"):
+        current.append(line)
+
+        if fence is None:
+            if _is_fence(line):
+                if len(current) > 1:
+                    blocks.append((current[:-1], None))
+                current = [line]
+                fence = line
+            elif not line.strip():
+                blocks.append((current, None))
+                current = []
+        elif len(current) > 1 and _is_fence(line) and not line.strip().strip("`~"):
+            blocks.append((current, fence))
+            current = []
+            fence = None
+
+    if current:
+        blocks.append((current, fence))
+    return blocks
+
+
+def _hard_split(line, limit):
+    if limit <= 0:
+        raise ValueError(f"limit must be positive, got {limit}")
+    pieces = []
+    while len(line) > limit:
+        cut = line.rfind(" ", 0, limit)
+        if cut < limit // 2:
+            cut = limit
+        pieces.append(line[:cut])
+        line = line[cut:]
+    pieces.append(line)
+    return pieces
+
+
+def _split_block(lines, fence, limit):
+    # A single block that is bigger than `limit` on its own.
+    if fence is None:
+        pieces = []
+        for line in lines:
+            pieces.extend(_hard_split(line, limit))
+        return _pack(pieces, limit)
+
+    # Re-open and close the fence around every piece of a long code block.
+    body = lines[1:]
+    if body and _is_fence(body[-1]):
+        body = body[:-1]
+
+    opener = fence.strip()
+    closer = opener[:3]
+    room = limit - len(opener) - len(closer) - 2
+    if room < limit // 2:
+        # The opener alone takes most of the limit; split it as prose.
+        return _split_block(lines, None, limit)
+
+    pieces = []
+    for line in body:
+        pieces.extend(_hard_split(line, room))
+
+    return [f"{opener}\n{chunk}\n{closer}" for chunk in _pack(pieces, room)]
+
+
+def _pack(lines, limit):
+    chunks = []
+    current = None
+    for line in lines:
+        if current is None:
+            current = line
+        elif len(current) + 1 + len(line) <= limit:
+            current += "\n" + line
+        else:
+            chunks.append(current)
+            current = line
+    if current is not None:
+        chunks.append(current)
+    return chunks
+
+
+def split_markdown(text, limit):
+    """Split `text` into as few chunks of at most `limit` characters as
+    possible, cutting between code blocks and paragraphs where it can."""
+    chunks = []
+    current = None
+
+    for lines, fence in _blocks(text):
+        block = "\n".join(lines)
+
+        if current is not None and len(current) + 1 + len(block) <= limit:
+            current += "\n" + block
+            continue
+
+        if current is not None:
+            chunks.append(current)
+            current = None
+
+        if len(block) <= limit:
+            current = block
+        else:
+            pieces = _split_block(lines, fence, limit)
+            chunks.extend(pieces[:-1])
+            current = pieces[-1]
+
+    if current is not None:
+        chunks.append(current)
+    return [c for c in chunks if c.strip()] or [text[:limit]]
+
+
+def _group_embeds(chunks):
+    messages = []
+    current = []
+    size = 0
+    for chunk in chunks:
+        if current and (
+            size + len(chunk) > EMBED_MESSAGE_LIMIT
+            or len(current) == EMBEDS_PER_MESSAGE
+        ):
+            messages.append(current)
+            current = []
+            size = 0
+        current.append(chunk)
+        size += len(chunk)
+    if current:
+        messages.append(current)
+    return messages
+
+
+async def deliver(channel, text, *, header="", use_embeds=True, colour=None,
+                  attach_over=None):
+    """Send `text` to `channel` in as few Discord calls as possible.
+
+    Short replies go out as one message. Longer ones are packed into
+    embeds (up to 6000 characters per message), and anything longer than
+    `attach_over` is sent as a single text attachment. `header` (mentions)
+    always goes in the message content so it still pings.
+    """
+    if len(header) + len(text) <= MESSAGE_LIMIT:
+        await channel.send(header + text)
+        return
+
+    if attach_over is not None and len(text) > attach_over:
+        fp = BytesIO(text.encode("utf-8"))
+        await channel.send(header or None, file=discord.File(fp, "reply.md"))
+        return
+
+    if not use_embeds:
+        for chunk in split_markdown(header + text, MESSAGE_LIMIT):
+            await channel.send(chunk)
+        return
+
+    for i, group in enumerate(_group_embeds(split_markdown(text, EMBED_CHUNK))):
+        embeds = [discord.Embed(description=chunk, colour=colour) for chunk in group]
+        await channel.send(header if i == 0 and header else None, embeds=embeds)
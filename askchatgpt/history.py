@@ -0,0 +1,256 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+from itertools import islice
+
+
+log = logging.getLogger("red.dylanpatrick.askchatgpt")
+
+
+def _entry_size(entry):
+    return len(json.dumps(entry).encode("utf-8"))
+
+
+class HistoryBuffer:
+    """Chat history that keeps a running count of its JSON-encoded size.
+
+    The size matches ``len(json.dumps(list(buffer)).encode("utf-8"))`` but is
+    updated per entry, so enforcing the byte cap never re-serializes the
+    whole history.
+
+    Entries also have an absolute index (``dropped + position``) that stays
+    stable while older entries are trimmed, which the rolling summary uses
+    to know how far it reaches.
+    """
+
+    __slots__ = ("_entries", "_sizes", "_payload", "dropped", "summary")
+
+    def __init__(self, entries=()):
+        self._entries = deque()
+        self._sizes = deque()
+        self._payload = 0
+        self.dropped = 0
+        self.summary = None  # (covered_until, text) of older turns
+        for entry in entries:
+            self.append(entry)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __reversed__(self):
+        return reversed(self._entries)
+
+    @property
+    def end(self):
+        return self.dropped + len(self._entries)
+
+    @property
+    def nbytes(self):
+        # "[" + "]" plus ", " between entries, as json.dumps writes it.
+        count = len(self._entries)
+        if not count:
+            return 2
+        return 2 + self._payload + 2 * (count - 1)
+
+    def append(self, entry):
+        size = _entry_size(entry)
+        self._entries.append(entry)
+        self._sizes.append(size)
+        self._payload += size
+
+    def popleft(self):
+        self._payload -= self._sizes.popleft()
+        self.dropped += 1
+        return self._entries.popleft()
+
+    def trim(self, max_bytes):
+        while self._entries and self.nbytes > max_bytes:
+            self.popleft()
+
+    def tail(self, n):
+        count = len(self._entries)
+        return list(islice(self._entries, max(count - n, 0), count))
+
+    def slice(self, start, stop):
+        # Absolute indexes; anything already trimmed is skipped.
+        start = max(start - self.dropped, 0)
+        stop = max(stop - self.dropped, 0)
+        return list(islice(self._entries, start, stop))
+
+    def to_list(self):
+        return list(self._entries)
+
+
+class HistoryStore:
+    """Per-scope chat history with write-behind persistence.
+
+    Each scope (guild or DM channel) is stored under its own ``HISTORY``
+    custom group, so saving one scope never rewrites the others. Writes
+    are batched: scopes are marked dirty and flushed on an interval, or
+    early once enough scopes are waiting.
+
+    Resident scopes are kept in LRU order under a global byte budget.
+    Idle, already-flushed scopes are evicted first and reload from Config
+    the next time they are asked for.
+    """
+
+    def __init__(self, config, flush_interval, flush_threshold, budget, timer=None):
+        self.config = config
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.budget = budget
+        # timer(family, name) -> context manager timing a Config round trip
+        self.timer = timer or (lambda family, name: nullcontext())
+
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._sizes = {}
+        self._resident_bytes = 0
+        self._dirty = set()
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def _group(self, scope_id):
+        return self.config.custom("HISTORY", scope_id)
+
+    # -----------------------------
+    # Lifecycle
+    # -----------------------------
+    async def migrate(self):
+        # Move the old single `memory` blob into per-scope groups.
+        legacy = await self.config.memory()
+        if not legacy:
+            return
+
+        for scope_id, history in legacy.items():
+            await self._group(scope_id).entries.set(history)
+
+        await self.config.memory.clear()
+        log.info("Migrated %d history scopes to per-scope storage.", len(legacy))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("History flush failed.")
+
+    # -----------------------------
+    # Cache
+    # -----------------------------
+    @property
+    def resident_bytes(self):
+        return self._resident_bytes
+
+    def _track(self, scope_id, history):
+        size = history.nbytes
+        self._resident_bytes += size - self._sizes.get(scope_id, 0)
+        self._sizes[scope_id] = size
+
+    def _drop(self, scope_id):
+        self.memory.pop(scope_id, None)
+        self._resident_bytes -= self._sizes.pop(scope_id, 0)
+
+    def _evict(self, keep=None):
+        if self._resident_bytes <= self.budget:
+            return
+
+        # Oldest first; dirty scopes stay until they have been flushed.
+        for scope_id in list(self.memory):
+            if self._resident_bytes <= self.budget:
+                break
+            if scope_id == keep or scope_id in self._dirty:
+                continue
+            self._drop(scope_id)
+
+    def set_budget(self, budget):
+        self.budget = budget
+        self._evict()
+
+    # -----------------------------
+    # Access
+    # -----------------------------
+    async def load(self, scope_id):
+        history = self.memory.get(scope_id)
+        if history is not None:
+            self.hits += 1
+            self.memory.move_to_end(scope_id)
+            return history
+
+        self.misses += 1
+        with self.timer("storage", "askchatgpt.history_load"):
+            history = HistoryBuffer(await self._group(scope_id).entries())
+
+        # Another task may have loaded the scope while we were waiting.
+        if scope_id in self.memory:
+            return self.memory[scope_id]
+
+        self.memory[scope_id] = history
+        self._track(scope_id, history)
+        self._evict(keep=scope_id)
+        return history
+
+    def save(self, scope_id, history):
+        self.memory[scope_id] = history
+        self.memory.move_to_end(scope_id)
+        self._track(scope_id, history)
+
+        self._dirty.add(scope_id)
+        if len(self._dirty) >= self.flush_threshold:
+            self._wake.set()
+
+        self._evict(keep=scope_id)
+
+    async def flush(self):
+        async with self._lock:
+            pending, self._dirty = self._dirty, set()
+
+            try:
+                for scope_id in list(pending):
+                    history = self.memory.get(scope_id)
+                    if history is not None:
+                        try:
+                            with self.timer("storage", "askchatgpt.history_save"):
+                                await self._group(scope_id).entries.set(history.to_list())
+                        except Exception:
+                            log.exception("Failed to save history for scope %s.", scope_id)
+                            self._dirty.add(scope_id)
+                    pending.discard(scope_id)
+            finally:
+                # Cancelled mid-flush: whatever wasn't written stays dirty.
+                self._dirty |= pending
+
+            self._evict()
+
+    async def clear(self, scope_id):
+        async with self._lock:
+            self._drop(scope_id)
+            self._dirty.discard(scope_id)
+            await self._group(scope_id).clear()
@@ -0,0 +1,180 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+
+
+log = logging.getLogger("red.dylanpatrick.askchatgpt")
+
+# Lower lanes are served first.
+LANE_CHAT = 0
+LANE_IMAGE = 1
+LANE_NAMES = {LANE_CHAT: "openai.chat", LANE_IMAGE: "openai.image"}
+
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0  # seconds
+BACKOFF_CAP = 30.0
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Refills `per_minute` units evenly over each minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount, now):
+        self._refill(now)
+        # A single request larger than the bucket waits for a full bucket.
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(error, attempt):
+    """Seconds to wait before retrying `error`, or None if it is final."""
+    status = getattr(error, "status_code", None)
+    transient = type(error).__name__ in {"APIConnectionError", "APITimeoutError"}
+    if status not in RETRYABLE_STATUS and not transient:
+        return None
+
+    # Full jitter, but never sooner than the server asked for.
+    backoff = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    return max(backoff, _retry_after(error) or 0.0)
+
+
+class RateLimiter:
+    """Shared requests- and tokens-per-minute limiter for upstream calls.
+
+    Callers queue in priority lanes, so short chat requests are released
+    ahead of image generations. A 429 pauses every lane until the server's
+    ``Retry-After`` has passed, instead of each caller retrying on its own.
+    """
+
+    def __init__(self, rpm, tpm, timer=None):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.retries = 0
+        # timer(family, name) -> context manager timing one upstream call
+        self.timer = timer or (lambda family, name: nullcontext())
+
+        self._queue = []  # (lane, seq, tokens, future)
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def configure(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._wake.set()
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for *_, future in self._queue:
+            future.cancel()
+        self._queue.clear()
+
+    async def acquire(self, tokens, lane):
+        if self._task is None:
+            self._task = asyncio.create_task(self._dispatch())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (lane, next(self._seq), tokens, future))
+        self._wake.set()
+        await future
+
+    async def _dispatch(self):
+        while True:
+            if not self._queue:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            lane, seq, tokens, future = self._queue[0]
+            if future.done():
+                # Caller gave up while waiting.
+                heapq.heappop(self._queue)
+                continue
+
+            now = time.monotonic()
+            delay = max(
+                self.paused_until - now,
+                self.requests.delay(1, now),
+                self.tokens.delay(tokens, now),
+            )
+            if delay > 0:
+                # Wake early if a higher-priority request arrives.
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._queue)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            future.set_result(None)
+
+    async def call(self, factory, tokens=0, lane=LANE_CHAT):
+        """Run `factory()` under the limiter, retrying transient errors."""
+        for attempt in range(MAX_RETRIES + 1):
+            await self.acquire(tokens, lane)
+            try:
+                with self.timer("outbound", LANE_NAMES[lane]):
+                    return await factory()
+            except Exception as e:
+                delay = retry_delay(e, attempt)
+                if delay is None or attempt == MAX_RETRIES:
+                    raise
+
+                if getattr(e, "status_code", None) == 429:
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+                self.retries += 1
+                log.debug("Retrying upstream call in %.1fs after %r.", delay, e)
+                await asyncio.sleep(delay)
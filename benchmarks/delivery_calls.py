@@ -0,0 +1,86 @@
+"""Count the Discord calls AskChatGPT makes to deliver replies of various sizes.
+
+Run from the repository root with discord.py installed:
+
+    python benchmarks/delivery_calls.py
+
+Each reply is sent to a stub channel that counts ``send`` calls and checks
+every message against Discord's size limits. The old behaviour (one message
+per 2000 characters) is shown for comparison.
+"""
+import asyncio
+import importlib.util
+import random
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SIZES = [500, 1900, 2500, 5000, 10000, 20000, 40000]
+ATTACH_OVER = 12000  # default attachment threshold of the cog
+
+
+def load(name, path):
+    # Load the module on its own so the cog (and Red) is not imported.
+    spec = importlib.util.spec_from_file_location(name, ROOT / path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+delivery = load("delivery", "askchatgpt/delivery.py")
+
+
+def reply(size, rng):
+    """Markdown of roughly `size` characters: prose mixed with code blocks."""
+    parts = []
+    while sum(map(len, parts)) < size:
+        if rng.random() < 0.3:
+            lines = (f"x = {i}  # " + "y" * rng.randint(0, 80) for i in range(rng.randint(3, 60)))
+            parts.append("```python\n" + "\n".join(lines) + "\n```")
+        else:
+            parts.append(" ".join("word" * rng.randint(1, 3) for _ in range(rng.randint(10, 120))))
+    return "\n\n".join(parts)
+
+
+EDGE_CASES = {
+    "long fence opener": "```" + "a" * 2100 + "\ncode\n```",
+    "opener at limit": "```" + "a" * 1996 + "\ncode\n```",
+    "one long line": "b" * 9000,
+    "unclosed fence": "```\n" + "c = 1\n" * 700,
+}
+
+
+class CountingChannel:
+    def __init__(self):
+        self.calls = 0
+
+    async def send(self, content=None, *, embeds=(), file=None):
+        self.calls += 1
+        assert content is None or len(content) <= delivery.MESSAGE_LIMIT
+        assert len(embeds) <= delivery.EMBEDS_PER_MESSAGE
+        assert all(len(e.description) <= 4096 for e in embeds)
+        assert sum(len(e.description) for e in embeds) <= delivery.EMBED_MESSAGE_LIMIT
+
+
+async def count(text, **kwargs):
+    channel = CountingChannel()
+    await delivery.deliver(channel, text, header="<@1> <@2>\n", **kwargs)
+    return channel.calls
+
+
+async def main():
+    rng = random.Random(1)
+    cases = [(str(size), reply(size, rng)) for size in SIZES] + list(EDGE_CASES.items())
+
+    print(f"{'case':>18} {'chars':>6} {'old':>4} {'plain':>6} {'embeds':>7} {'attach':>7}")
+    for name, text in cases:
+        for limit in (delivery.MESSAGE_LIMIT, delivery.EMBED_CHUNK):
+            assert all(len(c) <= limit for c in delivery.split_markdown(text, limit))
+        old = -(-len(text) // 2000)
+        plain = await count(text, use_embeds=False)
+        embeds = await count(text)
+        attach = await count(text, attach_over=ATTACH_OVER)
+        print(f"{name:>18} {len(text):>6} {old:>4} {plain:>6} {embeds:>7} {attach:>7}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
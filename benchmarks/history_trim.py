@@ -0,0 +1,65 @@
+"""Compare AskChatGPT's history trimming against the old dumps-per-pop loop.
+
+Run from the repository root:
+
+    python benchmarks/history_trim.py
+
+Builds a ~10MB history, trims ~100KB off it both ways, and checks that
+both leave the same entries and report the same size.
+"""
+import importlib.util
+import json
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+ENTRIES = 17000
+TRIM = 100_000  # bytes to trim off
+
+
+def load(name, path):
+    # Load the module on its own so the cog (and Red) is not imported.
+    spec = importlib.util.spec_from_file_location(name, ROOT / path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+history = load("history", "askchatgpt/history.py")
+
+
+def old_trim(entries, max_bytes):
+    # What _save_history did before HistoryBuffer.
+    size = len(json.dumps(entries).encode("utf-8"))
+    while entries and size > max_bytes:
+        entries.pop(0)
+        size = len(json.dumps(entries).encode("utf-8"))
+    return size
+
+
+def main():
+    entries = [
+        {"role": "user" if i % 2 else "assistant", "content": "x" * (400 + i % 300)}
+        for i in range(ENTRIES)
+    ]
+    total = len(json.dumps(entries).encode("utf-8"))
+    cap = total - TRIM
+    print(f"history {total / 1e6:.1f}MB, trimming to {cap / 1e6:.1f}MB")
+
+    buffer = history.HistoryBuffer(entries)
+    assert buffer.nbytes == total
+    start = time.perf_counter()
+    buffer.trim(cap)
+    new = time.perf_counter() - start
+
+    old_entries = list(entries)
+    start = time.perf_counter()
+    size = old_trim(old_entries, cap)
+    old = time.perf_counter() - start
+
+    assert buffer.to_list() == old_entries and buffer.nbytes == size
+    print(f"old {old:.2f}s, HistoryBuffer {new * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Compare WordTracker's compiled matcher against a findall per tracked word.
+
+Run from the repository root:
+
+    python benchmarks/word_matcher.py
+
+First checks that the matcher's counts match ``re.findall`` on randomized
+overlapping words, then times 1000 tracked words against synthetic chat
+messages.
+"""
+import importlib.util
+import random
+import re
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+WORDS = 1000
+MESSAGES = 5000
+ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+
+
+def load(name, path):
+    # Load the module on its own so the cog (and Red) is not imported.
+    spec = importlib.util.spec_from_file_location(name, ROOT / path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+matcher = load("matcher", "wordtracker/matcher.py")
+
+
+def findall_counts(words, text):
+    # What on_message did before WordMatcher.
+    counts = {w: len(re.findall(re.escape(w), text)) for w in words}
+    return {w: n for w, n in counts.items() if n}
+
+
+def check(rng, trials=3000):
+    for _ in range(trials):
+        words = {"".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 8))}
+        text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 40)))
+        got = matcher.WordMatcher(words).count(text)
+        assert got == findall_counts(words, text), (words, text, got)
+    print(f"counts match re.findall in {trials} randomized cases")
+
+
+def word(rng, low, high):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(low, high)))
+
+
+def main():
+    rng = random.Random(0)
+    check(rng)
+
+    words = list({word(rng, 3, 9) for _ in range(WORDS)})
+    messages = [" ".join(word(rng, 2, 8) for _ in range(rng.randint(3, 30))) for _ in range(MESSAGES)]
+
+    start = time.perf_counter()
+    for message in messages:
+        findall_counts(words, message)
+    old = time.perf_counter() - start
+
+    compiled = matcher.WordMatcher(words)
+    start = time.perf_counter()
+    for message in messages:
+        compiled.count(message)
+    new = time.perf_counter() - start
+
+    print(f"{len(words)} words, {MESSAGES} messages")
+    print(f"findall per word {old / MESSAGES * 1e6:.0f}us/msg, WordMatcher {new / MESSAGES * 1e6:.0f}us/msg")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+from .metrics import Metrics
+
+__red_end_user_data_statement__ = "This cog does not persistently store data or metadata about users."
+
+
+async def setup(bot):
+    await bot.add_cog(Metrics(bot))
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+
+from redbot.core import commands, Config
+from redbot.core.utils.chat_formatting import box, pagify
+
+from .registry import Registry
+
+log = logging.getLogger("red.dylanpatrick.metrics")
+
+EXPORT_INTERVAL = 15  # Seconds between Prometheus text file writes
+
+
+class Metrics(commands.Cog):
+    """Latency and error metrics for the other cogs in this repo.
+
+    Cogs opt in with a ``metrics_timer(family, name)`` attribute that is
+    a no-op by default and wrap their hot paths in it. While this cog is
+    loaded it replaces that attribute on every such cog with ``timer``,
+    so the lookup lives here rather than in each cog. While metrics are
+    off, ``timer`` is a shared no-op context manager too.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.config = Config.get_conf(self, identifier=7302946158)
+        default_global = {
+            "enabled": False,
+            "export_path": None,  # Prometheus text file, e.g. for node_exporter's textfile collector
+        }
+        self.config.register_global(**default_global)
+        self.registry = Registry()
+        self._export_task = None
+
+    async def cog_load(self):
+        self.registry.enabled = await self.config.enabled()
+        self._export_task = asyncio.create_task(self._export_loop())
+        for cog in self.bot.cogs.values():
+            self._attach(cog)
+
+    async def cog_unload(self):
+        if self._export_task is not None:
+            self._export_task.cancel()
+        for cog in self.bot.cogs.values():
+            self._detach(cog)
+
+    def _attach(self, cog):
+        if cog is not self and hasattr(type(cog), "metrics_timer"):
+            cog.metrics_timer = self.timer
+
+    def _detach(self, cog):
+        # Back to the cog's class-level no-op.
+        if cog.__dict__.get("metrics_timer") == self.timer:
+            del cog.metrics_timer
+
+    @commands.Cog.listener()
+    async def on_cog_add(self, cog):
+        self._attach(cog)
+
+    def timer(self, family, name):
+        """Context manager (sync or async) timing one call of `name`."""
+        return self.registry.timer(family, name)
+
+    async def _export_loop(self):
+        while True:
+            await asyncio.sleep(EXPORT_INTERVAL)
+            path = await self.config.export_path()
+            if not path or not self.registry.enabled:
+                continue
+            try:
+                await asyncio.to_thread(self.registry.write, path)
+            except OSError:
+                log.exception("Failed to write metrics to %s.", path)
+
+    @commands.group()
+    @commands.is_owner()
+    async def metrics(self, ctx):
+        """Show and configure cog metrics."""
+
+    @metrics.command(name="show")
+    async def metrics_show(self, ctx, family: str = None):
+        """Show call counts and latencies, optionally for one family."""
+        rows = [
+            (f"{fam}:{name}", h)
+            for (fam, name), h in sorted(self.registry.histograms.items())
+            if family is None or fam == family
+        ]
+        if not rows:
+            state = "on" if self.registry.enabled else "off"
+            return await ctx.send(f"No metrics recorded yet (metrics are {state}).")
+
+        width = max(len(label) for label, _ in rows)
+        lines = [f"{'name':<{width}}  {'calls':>8} {'errors':>6} {'avg ms':>8} {'p50 ms':>8} {'p95 ms':>8}"]
+        for label, h in rows:
+            avg = h.sum / h.count * 1000 if h.count else 0.0
+            lines.append(
+                f"{label:<{width}}  {h.count:>8} {h.errors:>6} {avg:>8.1f} "
+                f"{_ms(h.quantile(0.5)):>8} {_ms(h.quantile(0.95)):>8}"
+            )
+        for page in pagify("\n".join(lines), page_length=1900):
+            await ctx.send(box(page))
+
+    @metrics.command(name="toggle")
+    async def metrics_toggle(self, ctx, on: bool):
+        """Turn metric collection on or off."""
+        await self.config.enabled.set(on)
+        self.registry.enabled = on
+        await ctx.send(f"Metrics are now {'on' if on else 'off'}.")
+
+    @metrics.command(name="reset")
+    async def metrics_reset(self, ctx):
+        """Clear all recorded metrics."""
+        self.registry.reset()
+        await ctx.send("Metrics cleared.")
+
+    @metrics.command(name="export")
+    async def metrics_export(self, ctx, path: str = None):
+        """Write Prometheus text metrics to `path` every 15 seconds, or stop if omitted."""
+        if path is None:
+            await self.config.export_path.clear()
+            return await ctx.send("Metrics export stopped.")
+
+        try:
+            await asyncio.to_thread(self.registry.write, path)
+        except OSError as e:
+            return await ctx.send(f"I can't write to that path: {e}")
+        await self.config.export_path.set(path)
+        await ctx.send(f"Metrics will be written to `{path}` every {EXPORT_INTERVAL} seconds.")
+
+
+def _ms(seconds):
+    return "inf" if seconds == float("inf") else f"<={seconds * 1000:g}"
@@ -0,0 +1,131 @@
+import math
+import os
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+PREFIX = "redbot"
+
+# Upper bounds in seconds; the last bucket catches everything else.
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf,
+)
+
+# Returned by `timer` while disabled. nullcontext keeps no state, so one
+# instance can be shared by every caller, sync or async.
+NULL_TIMER = nullcontext()
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count", "errors")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+        self.errors = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the `q` quantile."""
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return math.inf
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        if exc_type is not None:
+            self.histogram.errors += 1
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class Registry:
+    """Latency histograms and error counts, grouped by family and name.
+
+    Families are broad kinds of work (``listener``, ``storage``,
+    ``outbound``); names say which handler, store operation or upstream
+    it was, e.g. ``wordtracker.on_message``. Timing only happens while
+    `enabled`; otherwise `timer` hands back a shared no-op.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}  # {(family, name): Histogram}
+
+    def timer(self, family, name):
+        if not self.enabled:
+            return NULL_TIMER
+        histogram = self.histograms.get((family, name))
+        if histogram is None:
+            histogram = self.histograms[(family, name)] = Histogram()
+        return _Timer(histogram)
+
+    def reset(self):
+        self.histograms.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        families = sorted({family for family, _ in self.histograms})
+        for family in families:
+            metric = f"{PREFIX}_{family}_seconds"
+            errors = f"{PREFIX}_{family}_errors_total"
+            items = sorted(
+                (name, h) for (fam, name), h in self.histograms.items() if fam == family
+            )
+
+            lines.append(f"# HELP {metric} Latency of {family} calls.")
+            lines.append(f"# TYPE {metric} histogram")
+            for name, h in items:
+                label = _escape(name)
+                cumulative = 0
+                for bound, n in zip(BUCKETS, h.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == math.inf else repr(bound)
+                    lines.append(f'{metric}_bucket{{name="{label}",le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{name="{label}"}} {h.sum!r}')
+                lines.append(f'{metric}_count{{name="{label}"}} {h.count}')
+
+            lines.append(f"# HELP {errors} {family.capitalize()} calls that raised.")
+            lines.append(f"# TYPE {errors} counter")
+            for name, h in items:
+                lines.append(f'{errors}{{name="{_escape(name)}"}} {h.errors}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Atomically replace `path` with the current metrics."""
+        text = self.render()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fp:
+            fp.write(text)
+        os.replace(tmp, path)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
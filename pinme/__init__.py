@@ -1,5 +1,11 @@
 from .pinme import PinMe
 
+__red_end_user_data_statement__ = (
+    "This cog stores the ID, name and message content of the authors of pinned messages. "
+    "Deleting a user's data unpins their messages; pins saved before author IDs were "
+    "recorded are only covered once their snapshot has been refreshed."
+)
+
 
 async def setup(bot):
     await bot.add_cog(PinMe(bot))
@@ -0,0 +1,47 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+FIELDS = ("channel_id", "message_id", "author", "created", "jump", "content")
+
+
+def export_rows(pinned, snapshots, channels):
+    """Yield one dict per pin in any of the `channels` ids."""
+    for ch_id, ids in pinned.items():
+        if int(ch_id) not in channels:
+            continue
+        for msg_id in ids:
+            snap = snapshots.get(str(msg_id), {})
+            created = snap.get("created")
+            yield {
+                "channel_id": int(ch_id),
+                "message_id": msg_id,
+                "author": snap.get("author"),
+                "created": (
+                    datetime.fromtimestamp(created, timezone.utc).isoformat()
+                    if created is not None else None
+                ),
+                "jump": snap.get("jump"),
+                "content": snap.get("content"),
+            }
+
+
+def write_export(fp, rows, fmt):
+    """Write `rows` to the binary file `fp` one at a time; returns the row count."""
+    text = io.TextIOWrapper(fp, encoding="utf-8", newline="", write_through=True)
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(text, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            text.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    # Leave `fp` open for the caller.
+    text.detach()
+    fp.seek(0)
+    return count
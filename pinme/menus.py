@@ -0,0 +1,67 @@
+import discord
+
+
+class PinPages(discord.ui.View):
+    """Paginated pin list that builds each page's embed only when it is shown."""
+
+    def __init__(self, cog, ctx, message_ids, per_page, timeout=180):
+        super().__init__(timeout=timeout)
+        self.cog = cog
+        self.ctx = ctx
+        self.message_ids = message_ids
+        self.per_page = per_page
+        self.page = 0
+        self.message = None
+
+    @property
+    def page_count(self):
+        return max(1, -(-len(self.message_ids) // self.per_page))
+
+    async def _render(self):
+        # Building a page can drop deleted pins, so clamp afterwards too.
+        self.page = min(self.page, self.page_count - 1)
+        embed = await self.cog.build_page(self.ctx, self.message_ids, self.page)
+        self.page = min(self.page, self.page_count - 1)
+        embed.set_footer(
+            text=f"Page {self.page + 1}/{self.page_count} • {len(self.message_ids)} pins"
+        )
+        return embed
+
+    async def start(self):
+        embed = await self._render()
+        if self.page_count == 1:
+            self.stop()
+            self.message = await self.ctx.send(embed=embed)
+        else:
+            self.message = await self.ctx.send(embed=embed, view=self)
+
+    async def _show(self, interaction):
+        await interaction.response.defer()
+        embed = await self._render()
+        await interaction.edit_original_response(embed=embed, view=self)
+
+    async def interaction_check(self, interaction):
+        return interaction.user.id == self.ctx.author.id
+
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+    @discord.ui.button(emoji="\N{BLACK LEFT-POINTING TRIANGLE}", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction, button):
+        self.page = (self.page - 1) % self.page_count
+        await self._show(interaction)
+
+    @discord.ui.button(emoji="\N{BLACK RIGHT-POINTING TRIANGLE}", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction, button):
+        self.page = (self.page + 1) % self.page_count
+        await self._show(interaction)
+
+    @discord.ui.button(emoji="\N{CROSS MARK}", style=discord.ButtonStyle.secondary)
+    async def close(self, interaction, button):
+        self.stop()
+        await interaction.response.defer()
+        await interaction.message.delete()
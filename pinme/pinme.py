@@ -1,20 +1,112 @@
 # File: pin_cog.py
 
+import asyncio
+import re
+import tempfile
+import time
+from contextlib import nullcontext
+
 import discord
 from discord.ext.commands import Cog
 from redbot.core import commands, Config
 from redbot.core.bot import Red
-from typing import Union
+from typing import Optional, Union
+
+from .export import export_rows, write_export
+from .menus import PinPages
+from .search import SearchIndex
+
+FETCH_CONCURRENCY = 5  # Parallel fetch_message calls when refreshing snapshots
+SNAPSHOT_TTL = 24 * 60 * 60  # Seconds before a snapshot is refreshed on view
+PINS_PER_PAGE = 5
+PREVIEW_LENGTH = 300  # Characters of content shown per pin in the list
+SEARCH_RESULTS = 10
+
+MESSAGE_LINK_RE = re.compile(
+    r"https?://(?:(?:ptb|canary)\.)?discord(?:app)?\.com/channels/(\d+)/(\d+)/(\d+)"
+)
+
+
+def snapshot(message: discord.Message) -> dict:
+    """What pin list needs to show a message without fetching it."""
+    return {
+        "author": str(message.author),
+        "author_id": message.author.id,
+        "content": message.content,
+        "created": message.created_at.timestamp(),
+        "jump": message.jump_url,
+        "fetched": time.time(),
+    }
+
+
+def add_pin_field(embed, snap, prefix=""):
+    content = snap["content"] or "*(No content)*"
+    if len(content) > PREVIEW_LENGTH:
+        content = content[:PREVIEW_LENGTH] + "…"
+    embed.add_field(
+        name=snap["author"][:256],
+        value=f"{prefix}<t:{int(snap['created'])}:f>\n{content}\n[Jump to message]({snap['jump']})",
+        inline=False,
+    )
+
 
 class PinMe(commands.Cog):
     """Custom pin system that bypasses Discord's native pin limit."""
 
+    metrics_timer = staticmethod(lambda family, name: nullcontext())
+
     def __init__(self, bot: Red):
         self.bot = bot
         self.config = Config.get_conf(self, identifier=1234567890)
-        default_guild = {"pinned": {}}  # {channel_id: [message_id, ...]}
+        default_guild = {
+            "pinned": {},     # {channel_id: [message_id, ...]}
+            "snapshots": {},  # {message_id: snapshot(message)}
+        }
         self.config.register_guild(**default_guild)
 
+        # {guild_id: {channel_id: {message_id, ...}}}, mirrors "pinned" so
+        # membership checks and deletes never have to read Config.
+        self._index = {}
+        self._search = {}  # {guild_id: SearchIndex}
+        # Shared by every fetch_message call the cog makes.
+        self._fetch_slots = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+    async def cog_load(self):
+        for guild_id, data in (await self.config.all_guilds()).items():
+            self._index[guild_id] = {
+                int(ch_id): set(ids) for ch_id, ids in data["pinned"].items() if ids
+            }
+            search = self._search_index(guild_id)
+            snapshots = data["snapshots"]
+            for ch_id, ids in data["pinned"].items():
+                for msg_id in ids:
+                    snap = snapshots.get(str(msg_id))
+                    if snap is not None:
+                        search.add(msg_id, int(ch_id), snap)
+
+    async def red_delete_data_for_user(self, *, requester, user_id):
+        # Unpin the user's messages, which drops their stored snapshots.
+        for guild_id, data in (await self.config.all_guilds()).items():
+            authored = {
+                int(msg_id)
+                for msg_id, snap in data["snapshots"].items()
+                if snap.get("author_id") == user_id
+            }
+            if not authored:
+                continue
+            for channel_id in list(self._index.get(guild_id, {})):
+                authored -= await self._forget(guild_id, channel_id, authored)
+            if authored:
+                async with self.config.guild_from_id(guild_id).snapshots() as snapshots:
+                    for msg_id in authored:
+                        snapshots.pop(str(msg_id), None)
+
+    def _pins(self, guild_id, channel_id):
+        return self._index.get(guild_id, {}).get(channel_id, set())
+
+    def _search_index(self, guild_id):
+        return self._search.setdefault(guild_id, SearchIndex())
+
     @commands.group(name="pin", invoke_without_command=True)
     @commands.guild_only()
     async def pin(self, ctx):
@@ -24,82 +116,290 @@ class PinMe(commands.Cog):
     @pin.command(name="add")
     async def pin_add(self, ctx, message: discord.Message):
         """Add a message to the custom pin list."""
-        channel_id = str(message.channel.id)
-        guild_data = await self.config.guild(ctx.guild).pinned()
-        guild_data.setdefault(channel_id, [])
-
-        if message.id in guild_data[channel_id]:
+        if message.id in self._pins(ctx.guild.id, message.channel.id):
             return await ctx.send("That message is already pinned.")
 
-        guild_data[channel_id].append(message.id)
-        await self.config.guild(ctx.guild).pinned.set(guild_data)
+        channels = self._index.setdefault(ctx.guild.id, {})
+        channels.setdefault(message.channel.id, set()).add(message.id)
+        async with self.config.guild(ctx.guild).pinned() as pinned:
+            pinned.setdefault(str(message.channel.id), []).append(message.id)
+        snap = snapshot(message)
+        async with self.config.guild(ctx.guild).snapshots() as snapshots:
+            snapshots[str(message.id)] = snap
+        self._search_index(ctx.guild.id).add(message.id, message.channel.id, snap)
 
         await ctx.send(f"Pinned message: {message.jump_url}")
 
     @pin.command(name="remove")
     async def pin_remove(self, ctx, message: discord.Message):
         """Remove a message from the custom pin list."""
-        channel_id = str(message.channel.id)
-        guild_data = await self.config.guild(ctx.guild).pinned()
-
-        if message.id not in guild_data.get(channel_id, []):
+        if message.id not in self._pins(ctx.guild.id, message.channel.id):
             return await ctx.send("That message is not pinned.")
 
-        guild_data[channel_id].remove(message.id)
-        await self.config.guild(ctx.guild).pinned.set(guild_data)
+        await self._forget(ctx.guild.id, message.channel.id, [message.id])
 
         await ctx.send("Message unpinned.")
 
     @pin.command(name="list")
     async def pin_list(self, ctx):
         """List all pinned messages in this channel."""
-        channel_id = str(ctx.channel.id)
+        if not self._pins(ctx.guild.id, ctx.channel.id):
+            return await ctx.send("No pinned messages in this channel.")
+
         guild_data = await self.config.guild(ctx.guild).pinned()
-        message_ids = guild_data.get(channel_id, [])
+        message_ids = guild_data.get(str(ctx.channel.id), [])
 
-        if not message_ids:
-            return await ctx.send("No pinned messages in this channel.")
+        await PinPages(self, ctx, message_ids, PINS_PER_PAGE).start()
+
+    async def _refresh(self, channel, message_ids):
+        """Fetch the given messages concurrently and return fresh snapshots.
+
+        Messages that no longer exist map to None; ones that could not be
+        fetched right now are left out and tried again on the next view.
+        """
+        async def fetch(msg_id):
+            async with self._fetch_slots:
+                try:
+                    with self.metrics_timer("outbound", "pinme.fetch_message"):
+                        message = await channel.fetch_message(msg_id)
+                    return msg_id, snapshot(message)
+                except discord.NotFound:
+                    return msg_id, None
+                except discord.HTTPException:
+                    return None
+
+        results = await asyncio.gather(*(fetch(m) for m in message_ids))
+        return dict(r for r in results if r is not None)
+
+    async def build_page(self, ctx, message_ids, page):
+        """Embed for one page of pins, refreshing only that page's snapshots."""
+        snapshots = await self.config.guild(ctx.guild).snapshots()
+        search = self._search_index(ctx.guild.id)
+        start = page * PINS_PER_PAGE
+
+        # Pins found deleted are dropped, which pulls later pins onto this
+        # page, so repeat until the page is full of fresh snapshots.
+        while True:
+            page_ids = message_ids[start:start + PINS_PER_PAGE]
+            now = time.time()
+            stale = [
+                m for m in page_ids
+                if now - snapshots.get(str(m), {}).get("fetched", 0) > SNAPSHOT_TTL
+            ]
+            if not stale:
+                break
+
+            fresh = await self._refresh(ctx.channel, stale)
+            gone = [m for m, snap in fresh.items() if snap is None]
+            if len(gone) < len(fresh):
+                async with self.config.guild(ctx.guild).snapshots() as stored:
+                    for msg_id, snap in fresh.items():
+                        if snap is not None:
+                            stored[str(msg_id)] = snapshots[str(msg_id)] = snap
+                            search.add(msg_id, ctx.channel.id, snap)
+            if not gone:
+                break
+            await self._forget(ctx.guild.id, ctx.channel.id, gone)
+            for msg_id in gone:
+                message_ids.remove(msg_id)
+
+        embed = discord.Embed(color=discord.Color.blurple())
+        for msg_id in page_ids:
+            snap = snapshots.get(str(msg_id))
+            if snap is not None:
+                add_pin_field(embed, snap)
+        if not embed.fields:
+            embed.description = "No pinned messages in this channel."
+        return embed
+
+    async def _forget(self, guild_id, channel_id, message_ids):
+        """Unpin any of `message_ids` pinned in the channel, in one write per key.
 
-        embeds = []
-        for msg_id in message_ids:
+        Returns the message ids that were actually pinned.
+        """
+        pins = self._pins(guild_id, channel_id)
+        gone = pins.intersection(message_ids)
+        if not gone:
+            return gone
+        pins -= gone
+        search = self._search_index(guild_id)
+        for msg_id in gone:
+            search.remove(msg_id)
+
+        group = self.config.guild_from_id(guild_id)
+        with self.metrics_timer("storage", "pinme.forget"):
+            async with group.pinned() as pinned:
+                ch_id = str(channel_id)
+                pinned[ch_id] = [m for m in pinned.get(ch_id, []) if m not in gone]
+            async with group.snapshots() as snapshots:
+                for msg_id in gone:
+                    snapshots.pop(str(msg_id), None)
+        return gone
+
+    @staticmethod
+    def _can_read(ctx, channel):
+        return channel.permissions_for(ctx.author).read_message_history
+
+    def _readable_channels(self, ctx):
+        """Ids of channels with pins whose history the invoker can read."""
+        readable = set()
+        for channel_id in self._index.get(ctx.guild.id, {}):
+            channel = ctx.guild.get_channel_or_thread(channel_id)
+            if channel is not None and self._can_read(ctx, channel):
+                readable.add(channel_id)
+        return readable
+
+    @pin.command(name="search")
+    async def pin_search(self, ctx, *, terms: str):
+        """Search this server's pins by content or author.
+
+        Only pins in channels whose history you can read are shown.
+        """
+        results = self._search_index(ctx.guild.id).search(
+            terms, SEARCH_RESULTS, self._readable_channels(ctx)
+        )
+        if not results:
+            return await ctx.send("No pins match that search.")
+
+        embed = discord.Embed(
+            title=f"Pins matching: {terms}"[:256], color=discord.Color.blurple()
+        )
+        for _, channel_id, snap in results:
+            add_pin_field(embed, snap, prefix=f"<#{channel_id}> • ")
+        await ctx.send(embed=embed)
+
+    async def _pin_many(self, guild, snaps):
+        """Pin every (channel_id, message_id, snapshot) not already pinned.
+
+        Returns how many were added. Both Config keys are saved in one write.
+        """
+        channels = self._index.setdefault(guild.id, {})
+        new = []
+        for channel_id, msg_id, snap in snaps:
+            pins = channels.setdefault(channel_id, set())
+            if msg_id not in pins:
+                pins.add(msg_id)
+                new.append((channel_id, msg_id, snap))
+        if not new:
+            return 0
+
+        search = self._search_index(guild.id)
+        with self.metrics_timer("storage", "pinme.pin_many"):
+            async with self.config.guild(guild).all() as data:
+                for channel_id, msg_id, snap in new:
+                    data["pinned"].setdefault(str(channel_id), []).append(msg_id)
+                    data["snapshots"][str(msg_id)] = snap
+                    search.add(msg_id, channel_id, snap)
+        return len(new)
+
+    @pin.command(name="import")
+    @commands.has_permissions(manage_messages=True)
+    async def pin_import(self, ctx, channel: Optional[discord.TextChannel] = None, *links: str):
+        """Import a channel's native pins, or the messages behind some message links.
+
+        With no arguments, imports this channel's native pins.
+        """
+        snaps = []
+        missing = 0
+
+        if links:
+            wanted = {}  # {channel_id: {message_id, ...}}
+            for link in links:
+                match = MESSAGE_LINK_RE.fullmatch(link.strip("<>"))
+                if match is None or int(match.group(1)) != ctx.guild.id:
+                    missing += 1
+                    continue
+                wanted.setdefault(int(match.group(2)), set()).add(int(match.group(3)))
+
+            async def fetch_channel(ch_id, ids):
+                source = ctx.guild.get_channel_or_thread(ch_id)
+                if source is None or not self._can_read(ctx, source):
+                    return ch_id, {}
+                return ch_id, await self._refresh(source, ids)
+
+            for ch_id, fresh in await asyncio.gather(
+                *(fetch_channel(ch_id, ids) for ch_id, ids in wanted.items())
+            ):
+                found = [(ch_id, m, snap) for m, snap in fresh.items() if snap is not None]
+                snaps.extend(found)
+                missing += len(wanted[ch_id]) - len(found)
+        else:
+            source = channel or ctx.channel
+            if not self._can_read(ctx, source):
+                return await ctx.send(f"You can't read the history of {source.mention}.")
             try:
-                msg = await ctx.channel.fetch_message(msg_id)
-                embed = discord.Embed(
-                    description=msg.content or "*(No content)*",
-                    timestamp=msg.created_at,
-                    color=discord.Color.blurple(),
-                )
-                embed.set_author(name=str(msg.author), icon_url=msg.author.avatar.url if msg.author.avatar else None)
-                embed.add_field(name="[Jump to message]", value=f"[Click here]({msg.jump_url})", inline=False)
-                embeds.append(embed)
-            except discord.NotFound:
-                continue
+                native = await source.pins()
+            except discord.HTTPException:
+                return await ctx.send(f"I couldn't read the pins in {source.mention}.")
+            # Oldest first, matching the order pin add would have produced.
+            snaps = [(source.id, msg.id, snapshot(msg)) for msg in reversed(native)]
+
+        added = await self._pin_many(ctx.guild, snaps)
+        message = f"Imported {added} pin(s); {len(snaps) - added} were already pinned."
+        if missing:
+            message += f" {missing} message(s) could not be found or you can't read them."
+        await ctx.send(message)
+
+    @pin.command(name="export")
+    @commands.has_permissions(manage_messages=True)
+    async def pin_export(self, ctx, scope: str = "channel", fmt: str = "jsonl"):
+        """Export pins as a JSONL or CSV file.
+
+        `scope` is `channel` or `server`; `fmt` is `jsonl` or `csv`.
+        """
+        scope, fmt = scope.lower(), fmt.lower()
+        if scope not in ("channel", "server") or fmt not in ("jsonl", "csv"):
+            return await ctx.send_help(ctx.command)
 
-        for embed in embeds:
-            await ctx.send(embed=embed)
+        data = await self.config.guild(ctx.guild).all()
+        if scope == "channel":
+            channels = {ctx.channel.id} if self._can_read(ctx, ctx.channel) else set()
+        else:
+            channels = self._readable_channels(ctx)
+        rows = export_rows(data["pinned"], data["snapshots"], channels)
+
+        # A real file: discord.File and TextIOWrapper need an io.IOBase,
+        # which SpooledTemporaryFile only is from Python 3.11.
+        with tempfile.TemporaryFile() as fp:
+            count = await asyncio.to_thread(write_export, fp, rows, fmt)
+            if not count:
+                return await ctx.send("No pins to export.")
+            try:
+                await ctx.send(
+                    f"Exported {count} pin(s).", file=discord.File(fp, f"pins.{fmt}")
+                )
+            except discord.HTTPException:
+                await ctx.send("The export is too large to upload here.")
 
     @pin.command(name="clear")
     @commands.has_permissions(manage_messages=True)
     async def pin_clear(self, ctx):
         """Clear all custom pins in this channel."""
-        channel_id = str(ctx.channel.id)
-        guild_data = await self.config.guild(ctx.guild).pinned()
+        pins = self._pins(ctx.guild.id, ctx.channel.id)
 
-        if channel_id in guild_data:
-            guild_data[channel_id] = []
-            await self.config.guild(ctx.guild).pinned.set(guild_data)
+        if pins:
+            await self._forget(ctx.guild.id, ctx.channel.id, list(pins))
             await ctx.send("All pins in this channel have been cleared.")
         else:
             await ctx.send("No pins to clear.")
 
+    # Raw events also fire for messages that are not in the cache, and a
+    # purge arrives as a single bulk event, so both are handled here. Deletes
+    # of messages that are not pinned stop at one set lookup.
+
     @commands.Cog.listener()
-    async def on_message_delete(self, message: discord.Message):
-        if not message.guild:
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if payload.guild_id is None:
             return
+        with self.metrics_timer("listener", "pinme.on_raw_message_delete"):
+            if payload.message_id in self._pins(payload.guild_id, payload.channel_id):
+                await self._forget(payload.guild_id, payload.channel_id, [payload.message_id])
 
-        guild_data = await self.config.guild(message.guild).pinned()
-        ch_id = str(message.channel.id)
-
-        if ch_id in guild_data and message.id in guild_data[ch_id]:
-            guild_data[ch_id].remove(message.id)
-            await self.config.guild(message.guild).pinned.set(guild_data)
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        if payload.guild_id is None:
+            return
+        with self.metrics_timer("listener", "pinme.on_raw_bulk_message_delete"):
+            pins = self._pins(payload.guild_id, payload.channel_id)
+            if pins and not pins.isdisjoint(payload.message_ids):
+                await self._forget(payload.guild_id, payload.channel_id, payload.message_ids)
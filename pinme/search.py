@@ -0,0 +1,79 @@
+import heapq
+import math
+import re
+from collections import Counter
+from operator import itemgetter
+
+TOKEN_RE = re.compile(r"\w+")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.casefold())
+
+
+class SearchIndex:
+    """BM25-ranked inverted index over the pin snapshots of one guild.
+
+    Each pin is indexed by its author and content. Pins without a
+    snapshot yet are indexed once one is fetched.
+    """
+
+    def __init__(self):
+        self.postings = {}  # {term: {message_id: term frequency}}
+        self.docs = {}  # {message_id: (channel_id, snapshot, length, terms)}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, message_id, channel_id, snap):
+        """Index a pin, replacing any earlier snapshot of it."""
+        self.remove(message_id)
+        tokens = tokenize(f"{snap['author']} {snap['content']}")
+        counts = Counter(tokens)
+        for term, n in counts.items():
+            self.postings.setdefault(term, {})[message_id] = n
+        self.docs[message_id] = (channel_id, snap, len(tokens), tuple(counts))
+        self._total_length += len(tokens)
+
+    def remove(self, message_id):
+        doc = self.docs.pop(message_id, None)
+        if doc is None:
+            return
+        self._total_length -= doc[2]
+        for term in doc[3]:
+            posting = self.postings[term]
+            del posting[message_id]
+            if not posting:
+                del self.postings[term]
+
+    def search(self, query, limit, channels=None):
+        """Best `limit` matches for `query` as (message_id, channel_id, snapshot).
+
+        If `channels` is given, only pins in those channels are considered.
+        """
+        terms = set(tokenize(query))
+        n = len(self.docs)
+        if not terms or not n:
+            return []
+
+        avg_length = self._total_length / n or 1
+        docs = self.docs
+        scores = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for message_id, tf in posting.items():
+                if channels is not None and docs[message_id][0] not in channels:
+                    continue
+                norm = K1 * (1 - B + B * docs[message_id][2] / avg_length)
+                scores[message_id] = scores.get(message_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+        best = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        return [(message_id, docs[message_id][0], docs[message_id][1]) for message_id, _ in best]
@@ -1,5 +1,5 @@
 from .thevalley import TheValley
 
 
-def setup(bot):
-    bot.add_cog(TheValley(bot))
+async def setup(bot):
+    await bot.add_cog(TheValley(bot))
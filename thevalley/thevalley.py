@@ -1,45 +1,364 @@
-from redbot.core import commands
+from redbot.core import commands, Config
+from redbot.core.utils.chat_formatting import humanize_timedelta
 import discord
 import asyncio
+import heapq
+import logging
+import time
+from contextlib import nullcontext
+
+log = logging.getLogger("red.dylanpatrick.thevalley")
+
+VALLEY_CHANNEL = "the-valley"
+DEFAULT_DURATION = 10  # Seconds a valleykick lasts unless changed with valleyduration
+RETRY_DELAY = 60  # Seconds before retrying a revert that could not be done yet
+
 
 class TheValley(commands.Cog):
-    """Cog to restrict users to post in 'The Valley' for 10 seconds."""
+    """Cog to restrict users to post in 'The Valley' for a while."""
+
+    metrics_timer = staticmethod(lambda family, name: nullcontext())
 
     def __init__(self, bot):
         self.bot = bot
+        self.config = Config.get_conf(self, identifier=8264019375)
+        default_guild = {
+            "valley_role": None,  # Role whose overwrites do the restricting
+            "duration": DEFAULT_DURATION,
+            # {member_id: {"until", "channel", "role", "original", "notify"}}
+            "restrictions": {},
+        }
+        self.config.register_guild(**default_guild)
 
-    @commands.command()
-    @commands.has_permissions(manage_roles=True)
-    async def valleykick(self, ctx, member: discord.Member):
-        """Restrict a user to post in 'The Valley' for 10 seconds."""
-        valley_channel = discord.utils.get(ctx.guild.text_channels, name='the-valley')
-        if valley_channel is None:
-            await ctx.send("Channel 'The Valley' not found.")
+        # Every pending revert as (until, guild_id, member_id). Entries that
+        # were lifted or extended stay in the heap and are skipped when
+        # they come up, because they no longer match self._active.
+        self._heap = []
+        self._active = {}  # {(guild_id, member_id): until}
+        self._wake = asyncio.Event()
+        self._scheduler = None
+
+    async def cog_load(self):
+        for guild_id, data in (await self.config.all_guilds()).items():
+            for member_id, entry in data["restrictions"].items():
+                self._schedule(guild_id, int(member_id), entry["until"])
+        self._scheduler = asyncio.create_task(self._run_scheduler())
+
+    async def cog_unload(self):
+        # Pending reverts stay in Config and are picked up on next load.
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+
+    # Scheduling
+
+    def _schedule(self, guild_id, member_id, until):
+        self._active[(guild_id, member_id)] = until
+        heapq.heappush(self._heap, (until, guild_id, member_id))
+        self._wake.set()
+
+    async def _run_scheduler(self):
+        # cog_load runs before the gateway connects; guilds are unknown until then.
+        await self.bot.wait_until_red_ready()
+        while True:
+            now = time.time()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap))
+
+            if due:
+                try:
+                    await self._expire(due)
+                except Exception:
+                    log.exception("Failed to lift expired Valley restrictions.")
+                continue
+
+            delay = self._heap[0][0] - now if self._heap else None
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _expire(self, due):
+        by_guild = {}
+        for until, guild_id, member_id in due:
+            if self._active.get((guild_id, member_id)) == until:
+                del self._active[(guild_id, member_id)]
+                by_guild.setdefault(guild_id, []).append(member_id)
+
+        for guild_id, member_ids in by_guild.items():
+            guild = self.bot.get_guild(guild_id)
+            if guild is None:
+                # The bot left the server; there is nothing left to revert.
+                for key in [k for k in self._active if k[0] == guild_id]:
+                    del self._active[key]
+                await self.config.guild_from_id(guild_id).restrictions.clear()
+                continue
+            if guild.unavailable:
+                # Keep the restrictions and try again once the guild is back.
+                for member_id in member_ids:
+                    self._schedule(guild_id, member_id, time.time() + RETRY_DELAY)
+                continue
+
+            restrictions = await self.config.guild(guild).restrictions()
+            lifted = {}  # {member_id: until} of entries that were reverted
+            for member_id in member_ids:
+                entry = restrictions.get(str(member_id))
+                if entry is None:
+                    continue
+                try:
+                    with self.metrics_timer("outbound", "thevalley.revert"):
+                        reverted = await self._revert(guild, member_id, entry)
+                except Exception:
+                    # Keep the entry; a failed revert is retried, never dropped.
+                    log.exception("Failed to lift the Valley restriction on %s.", member_id)
+                    self._schedule(guild_id, member_id, time.time() + RETRY_DELAY)
+                    continue
+                if not reverted:
+                    # Left the server; on_member_join finishes the revert.
+                    continue
+
+                lifted[member_id] = entry["until"]
+                channel = guild.get_channel(entry["notify"])
+                if channel is not None:
+                    try:
+                        await channel.send(
+                            f"<@{member_id}> can now post in other channels again.",
+                            allowed_mentions=discord.AllowedMentions.none(),
+                        )
+                    except discord.HTTPException:
+                        pass
+
+            if lifted:
+                # One Config write per guild per batch. An entry that a new
+                # valleykick replaced in the meantime is left alone.
+                async with self.config.guild(guild).restrictions() as restrictions:
+                    for member_id, until in lifted.items():
+                        current = restrictions.get(str(member_id))
+                        if current is not None and current["until"] == until:
+                            del restrictions[str(member_id)]
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        # Finish reverts that came due while the member was away.
+        if (member.guild.id, member.id) in self._active:
             return
+        async with self.config.guild(member.guild).restrictions() as restrictions:
+            entry = restrictions.get(str(member.id))
+            if entry is None:
+                return
+            with self.metrics_timer("outbound", "thevalley.revert"):
+                await self._revert(member.guild, member.id, entry)
+            del restrictions[str(member.id)]
+
+    # Applying and reverting
+
+    def _plan(self, member, valley_channel, role):
+        """What is needed to revert a restriction, captured before applying it."""
+        if role is not None:
+            return {"channel": valley_channel.id, "role": role.id, "original": None}
 
         # Store original permissions
         original_overwrite = valley_channel.overwrites_for(member)
+        original = None
+        if not original_overwrite.is_empty():
+            allow, deny = original_overwrite.pair()
+            original = [allow.value, deny.value]
+        return {"channel": valley_channel.id, "role": None, "original": original}
+
+    async def _restrict(self, guild, member, valley_channel, entry):
+        if entry["role"] is not None:
+            # The role's overwrites are already in place: one call each way.
+            await member.add_roles(guild.get_role(entry["role"]), reason="Sent to The Valley")
+            return
 
         # Modify permissions to allow sending messages only in 'the-valley'
         overwrite = discord.PermissionOverwrite(send_messages=True)
         await valley_channel.set_permissions(member, overwrite=overwrite)
 
         # Other channels: deny sending messages
-        for channel in ctx.guild.text_channels:
+        for channel in guild.text_channels:
             if channel != valley_channel:
                 await channel.set_permissions(member, send_messages=False)
 
-        # Notify and wait for 10 seconds
-        await ctx.send(f"{member} is now restricted to 'The Valley' for 10 seconds.")
-        await asyncio.sleep(10)
+    async def _revert(self, guild, member_id, entry):
+        """Undo a restriction. Returns False if the member has left.
 
-        # Revert permissions
-        await valley_channel.set_permissions(member, overwrite=original_overwrite)
-        for channel in ctx.guild.text_channels:
-            if channel != valley_channel:
+        Members lose their roles when they leave, so role mode is done
+        either way, but channel overwrites can only be edited for a member
+        who is in the server.
+        """
+        member = guild.get_member(member_id)
+        if entry["role"] is not None:
+            role = guild.get_role(entry["role"])
+            if member is not None and role is not None:
+                await member.remove_roles(role, reason="Back from The Valley")
+            return True
+        if member is None:
+            return False
+
+        for channel in guild.text_channels:
+            if channel.id == entry["channel"] and entry["original"]:
+                allow, deny = entry["original"]
+                original_overwrite = discord.PermissionOverwrite.from_pair(
+                    discord.Permissions(allow), discord.Permissions(deny)
+                )
+                await channel.set_permissions(member, overwrite=original_overwrite)
+            else:
                 await channel.set_permissions(member, overwrite=None)
+        return True
+
+    # Role mode
+
+    async def _valley_role(self, guild):
+        role_id = await self.config.guild(guild).valley_role()
+        return guild.get_role(role_id) if role_id else None
+
+    async def _setup_role_overwrites(self, guild, role, valley_channel):
+        """Set the valley role's overwrite on every text channel, once."""
+        for channel in guild.text_channels:
+            allowed = channel == valley_channel
+            if channel.overwrites_for(role).send_messages is not allowed:
+                await channel.set_permissions(role, send_messages=allowed)
+
+    @commands.command()
+    @commands.guild_only()
+    @commands.admin_or_permissions(manage_roles=True)
+    async def valleyrole(self, ctx, role: discord.Role = None):
+        """Restrict members with a role instead of per-channel overwrites.
+
+        Sets up the role's overwrites on every text channel once, so each
+        valleykick only adds and removes the role. Run without a role to
+        go back to per-channel overwrites.
+        """
+        if role is None:
+            await self.config.guild(ctx.guild).valley_role.clear()
+            await ctx.send("valleykick will set per-channel overwrites again.")
+            return
 
+        valley_channel = discord.utils.get(ctx.guild.text_channels, name=VALLEY_CHANNEL)
+        if valley_channel is None:
+            await ctx.send("Channel 'The Valley' not found.")
+            return
+        if role.is_default() or role.managed:
+            await ctx.send("That role can't be given to members.")
+            return
+        if role >= ctx.guild.me.top_role:
+            await ctx.send("That role is above my highest role, so I can't assign it.")
+            return
+        if ctx.author != ctx.guild.owner and role >= ctx.author.top_role:
+            await ctx.send("That role is not below your highest role.")
+            return
+
+        async with ctx.typing():
+            await self._setup_role_overwrites(ctx.guild, role, valley_channel)
+        await self.config.guild(ctx.guild).valley_role.set(role.id)
+        await ctx.send(
+            f"valleykick will now use {role.name}. Roles with a channel "
+            "overwrite that allows sending still win over it there."
+        )
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        # Keep the role's overwrites covering channels made after setup.
+        if not isinstance(channel, discord.TextChannel):
+            return
+        role = await self._valley_role(channel.guild)
+        if role is not None and channel.name != VALLEY_CHANNEL:
+            await channel.set_permissions(role, send_messages=False)
+
+    # Commands
+
+    @commands.command()
+    @commands.guild_only()
+    @commands.admin_or_permissions(manage_roles=True)
+    async def valleyduration(self, ctx, seconds: int):
+        """Set how long valleykick restricts a user for."""
+        if seconds < 1:
+            await ctx.send("The duration must be at least one second.")
+            return
+        await self.config.guild(ctx.guild).duration.set(seconds)
+        await ctx.send(f"valleykick now lasts {humanize_timedelta(seconds=seconds)}.")
+
+    @commands.command()
+    @commands.guild_only()
+    @commands.has_permissions(manage_roles=True)
+    async def valleykick(self, ctx, member: discord.Member):
+        """Restrict a user to post in 'The Valley' for a while.
+
+        Kicking someone who is already in The Valley restarts their timer.
+        """
+        valley_channel = discord.utils.get(ctx.guild.text_channels, name=VALLEY_CHANNEL)
+        if valley_channel is None:
+            await ctx.send("Channel 'The Valley' not found.")
+            return
+
+        guild_conf = self.config.guild(ctx.guild)
+        duration = await guild_conf.duration()
+        entry = (await guild_conf.restrictions()).get(str(member.id))
+        apply = entry is None
+        if apply:
+            entry = self._plan(member, valley_channel, await self._valley_role(ctx.guild))
+
+        # Saved before anything is applied, so an interrupted kick can still
+        # be reverted after a restart.
+        entry["until"] = time.time() + duration
+        entry["notify"] = ctx.channel.id
+        async with guild_conf.restrictions() as restrictions:
+            restrictions[str(member.id)] = entry
+
+        try:
+            if apply:
+                with self.metrics_timer("outbound", "thevalley.restrict"):
+                    await self._restrict(ctx.guild, member, valley_channel, entry)
+        finally:
+            # Scheduled only once applying is over, so the revert never
+            # races it; on failure the revert cleans up the partial fan-out.
+            self._schedule(ctx.guild.id, member.id, entry["until"])
+
+        await ctx.send(
+            f"{member} is now restricted to 'The Valley' for {humanize_timedelta(seconds=duration)}."
+        )
+
+    @commands.command()
+    @commands.guild_only()
+    @commands.has_permissions(manage_roles=True)
+    async def valleylift(self, ctx, member: discord.Member):
+        """Let a user out of The Valley early."""
+        if self._active.pop((ctx.guild.id, member.id), None) is None:
+            await ctx.send(f"{member} is not in The Valley.")
+            return
+
+        entry = (await self.config.guild(ctx.guild).restrictions()).get(str(member.id))
+        if entry is not None:
+            try:
+                with self.metrics_timer("outbound", "thevalley.revert"):
+                    await self._revert(ctx.guild, member.id, entry)
+            except Exception:
+                # Leave it to the scheduler to retry.
+                self._schedule(ctx.guild.id, member.id, time.time() + RETRY_DELAY)
+                raise
+            async with self.config.guild(ctx.guild).restrictions() as restrictions:
+                restrictions.pop(str(member.id), None)
         await ctx.send(f"{member} can now post in other channels again.")
 
-def setup(bot):
-    bot.add_cog(TheValley(bot))
+    @commands.command()
+    @commands.guild_only()
+    @commands.has_permissions(manage_roles=True)
+    async def valleylist(self, ctx):
+        """List users currently in The Valley."""
+        restrictions = await self.config.guild(ctx.guild).restrictions()
+        if not restrictions:
+            await ctx.send("Nobody is in The Valley.")
+            return
+
+        lines = [
+            f"<@{member_id}> until <t:{int(entry['until'])}:T> (<t:{int(entry['until'])}:R>)"
+            for member_id, entry in sorted(restrictions.items(), key=lambda i: i[1]["until"])
+        ]
+        embed = discord.Embed(
+            title="In The Valley",
+            description="\n".join(lines)[:4096],
+            colour=await ctx.embed_colour(),
+        )
+        await ctx.send(embed=embed)
@@ -0,0 +1,68 @@
+from collections import deque
+
+
+class WordMatcher:
+    """Aho-Corasick automaton that counts every tracked substring in one pass.
+
+    Counts match ``len(re.findall(re.escape(word), text))`` for each word:
+    occurrences of the same word never overlap, while different words may
+    overlap each other freely.
+    """
+
+    __slots__ = ("words", "_lengths", "_goto", "_fail", "_out")
+
+    def __init__(self, words):
+        self.words = list(words)
+        self._lengths = [len(w) for w in self.words]
+        self._goto = [{}]
+        self._out = [[]]
+
+        for index, word in enumerate(self.words):
+            if not word:
+                continue
+            node = 0
+            for ch in word:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(index)
+
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def __bool__(self):
+        return any(self._lengths)
+
+    def count(self, text):
+        """Return ``{word: occurrences}`` for the words found in `text`."""
+        goto, fail, out, lengths = self._goto, self._fail, self._out, self._lengths
+        counts = {}
+        last_end = {}
+        node = 0
+
+        for end, ch in enumerate(text, 1):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            for index in out[node]:
+                # Like findall, skip matches overlapping the last one counted.
+                if end - lengths[index] >= last_end.get(index, 0):
+                    last_end[index] = end
+                    counts[index] = counts.get(index, 0) + 1
+
+        words = self.words
+        return {words[index]: n for index, n in counts.items()}
@@ -0,0 +1,291 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# How long each bucket size is kept. Month buckets are kept forever.
+RETENTION = {
+    "hour": 7 * DAY,
+    "day": 400 * DAY,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counts (
+    guild INTEGER NOT NULL,
+    word  TEXT    NOT NULL,
+    user  INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (guild, word, user)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS counts_top ON counts (guild, word, count DESC);
+CREATE TABLE IF NOT EXISTS totals (
+    guild INTEGER NOT NULL,
+    word  TEXT    NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (guild, word)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS buckets (
+    guild INTEGER NOT NULL,
+    word  TEXT    NOT NULL,
+    span  TEXT    NOT NULL,
+    start INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (guild, word, span, start)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS buckets_window ON buckets (guild, span, start);
+CREATE TABLE IF NOT EXISTS backfill (
+    word    TEXT    NOT NULL,
+    channel INTEGER NOT NULL,
+    before  INTEGER,
+    done    INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (word, channel)
+) WITHOUT ROWID;
+"""
+
+
+def _marks(values):
+    return ", ".join("?" * len(values))
+
+
+def hour_start(ts):
+    return int(ts) // HOUR * HOUR
+
+
+def _day_start(ts):
+    return int(ts) // DAY * DAY
+
+
+def _month_start(ts):
+    dt = datetime.fromtimestamp(ts, timezone.utc)
+    return int(datetime(dt.year, dt.month, 1, tzinfo=timezone.utc).timestamp())
+
+
+def window_span(seconds):
+    """Coarsest bucket size that still resolves a window of `seconds`."""
+    if seconds <= 2 * DAY:
+        return "hour"
+    if seconds <= RETENTION["day"]:
+        return "day"
+    return "month"
+
+
+def span_start(span, ts):
+    if span == "hour":
+        return hour_start(ts)
+    if span == "day":
+        return _day_start(ts)
+    return _month_start(ts)
+
+
+class CountStore:
+    """Per-guild word counts in SQLite, one indexed row per (guild, word, user).
+
+    All database work runs on a single worker thread so the event loop
+    never blocks on disk and statements never interleave. Increments are
+    collected in memory by the caller and applied with `add` in one
+    transaction.
+
+    Alongside the cumulative counts, per-(guild, word) totals are kept in
+    hour, day and month buckets. All three are updated on write, so a
+    windowed query only sums the buckets of one size that cover it.
+    Old hour and day buckets are dropped by `prune`.
+    """
+
+    def __init__(self, path, timer=None):
+        self.path = str(path)
+        self._db = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wordtracker")
+        # timer(family, name) -> context manager timing one operation
+        self.timer = timer or (lambda family, name: nullcontext())
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        with self.timer("storage", "wordtracker." + fn.__name__.lstrip("_")):
+            return await loop.run_in_executor(self._executor, fn, *args)
+
+    # Lifecycle
+
+    def _open(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    async def open(self):
+        await self._run(self._open)
+
+    def _close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def close(self):
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
+
+    # Writes
+
+    def _add(self, deltas, hours, checkpoint):
+        # deltas: {(guild_id, word, user_id): increment}
+        # hours: {(guild_id, word, hour_start): increment}
+        # checkpoint: (word, channel_id, before_message_id, done) or None
+        totals = {}
+        for (guild, word, _), n in deltas.items():
+            totals[(guild, word)] = totals.get((guild, word), 0) + n
+
+        rollups = {}
+        for (guild, word, start), n in hours.items():
+            for span in ("hour", "day", "month"):
+                key = (guild, word, span, span_start(span, start))
+                rollups[key] = rollups.get(key, 0) + n
+
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO counts (guild, word, user, count) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (guild, word, user) DO UPDATE SET count = count + excluded.count",
+                [(g, w, u, n) for (g, w, u), n in deltas.items()],
+            )
+            self._db.executemany(
+                "INSERT INTO totals (guild, word, count) VALUES (?, ?, ?) "
+                "ON CONFLICT (guild, word) DO UPDATE SET count = count + excluded.count",
+                [(g, w, n) for (g, w), n in totals.items()],
+            )
+            self._db.executemany(
+                "INSERT INTO buckets (guild, word, span, start, count) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (guild, word, span, start) DO UPDATE SET count = count + excluded.count",
+                [(g, w, span, start, n) for (g, w, span, start), n in rollups.items()],
+            )
+            if checkpoint is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO backfill (word, channel, before, done) "
+                    "VALUES (?, ?, ?, ?)",
+                    checkpoint,
+                )
+
+    async def add(self, deltas, hours=None, checkpoint=None):
+        """Apply increments, saving a backfill `checkpoint` in the same transaction."""
+        if deltas or hours or checkpoint:
+            await self._run(self._add, deltas, hours or {}, checkpoint)
+
+    def _prune(self, now):
+        with self._db:
+            for span, keep in RETENTION.items():
+                self._db.execute(
+                    "DELETE FROM buckets WHERE span = ? AND start < ?", (span, now - keep)
+                )
+
+    async def prune(self, now):
+        await self._run(self._prune, now)
+
+    def _remove_word(self, word):
+        with self._db:
+            self._db.execute("DELETE FROM counts WHERE word = ?", (word,))
+            self._db.execute("DELETE FROM totals WHERE word = ?", (word,))
+            self._db.execute("DELETE FROM buckets WHERE word = ?", (word,))
+            self._db.execute("DELETE FROM backfill WHERE word = ?", (word,))
+
+    async def remove_word(self, word):
+        await self._run(self._remove_word, word)
+
+    def _move_guild(self, source, target):
+        with self._db:
+            for table, key in (
+                ("counts", "word, user"),
+                ("totals", "word"),
+                ("buckets", "word, span, start"),
+            ):
+                self._db.execute(
+                    f"INSERT INTO {table} (guild, {key}, count) "
+                    f"SELECT ?, {key}, count FROM {table} WHERE guild = ? "
+                    f"ON CONFLICT (guild, {key}) DO UPDATE SET count = count + excluded.count",
+                    (target, source),
+                )
+                self._db.execute(f"DELETE FROM {table} WHERE guild = ?", (source,))
+
+    async def move_guild(self, source, target):
+        """Add every count of guild `source` into guild `target`."""
+        await self._run(self._move_guild, source, target)
+
+    # Reads
+
+    def _total(self, guilds, word):
+        row = self._db.execute(
+            f"SELECT COALESCE(SUM(count), 0) FROM totals WHERE guild IN ({_marks(guilds)}) AND word = ?",
+            (*guilds, word),
+        ).fetchone()
+        return row[0]
+
+    async def total(self, guilds, word):
+        return await self._run(self._total, tuple(guilds), word)
+
+    def _global_total(self, word):
+        row = self._db.execute(
+            "SELECT COALESCE(SUM(count), 0) FROM totals WHERE word = ?", (word,)
+        ).fetchone()
+        return row[0]
+
+    async def global_total(self, word):
+        return await self._run(self._global_total, word)
+
+    def _totals(self, guilds):
+        rows = self._db.execute(
+            f"SELECT word, SUM(count) FROM totals WHERE guild IN ({_marks(guilds)}) GROUP BY word",
+            guilds,
+        ).fetchall()
+        return dict(rows)
+
+    async def totals(self, guilds):
+        return await self._run(self._totals, tuple(guilds))
+
+    def _window_totals(self, guild, seconds, now):
+        span = window_span(seconds)
+        since = now - seconds
+        rows = self._db.execute(
+            "SELECT word, SUM(count) FROM buckets "
+            "WHERE guild = ? AND span = ? AND start >= ? GROUP BY word",
+            (guild, span, span_start(span, since)),
+        ).fetchall()
+        return dict(rows)
+
+    async def window_totals(self, guild, seconds, now):
+        """Counts per word over the last `seconds` before `now`, from rollups.
+
+        The window is widened to the start of the bucket it begins in, so
+        it is only as precise as the bucket size chosen for it.
+        """
+        return await self._run(self._window_totals, guild, seconds, now)
+
+    def _backfill_state(self, word, channel):
+        row = self._db.execute(
+            "SELECT before, done FROM backfill WHERE word = ? AND channel = ?", (word, channel)
+        ).fetchone()
+        return (row[0], bool(row[1])) if row else (None, False)
+
+    async def backfill_state(self, word, channel):
+        """(oldest message id scanned, finished) for a backfill of `word` in `channel`."""
+        return await self._run(self._backfill_state, word, channel)
+
+    def _top(self, guilds, word, limit, offset):
+        if len(guilds) == 1:
+            return self._db.execute(
+                "SELECT user, count FROM counts WHERE guild = ? AND word = ? "
+                "ORDER BY count DESC LIMIT ? OFFSET ?",
+                (*guilds, word, limit, offset),
+            ).fetchall()
+        return self._db.execute(
+            f"SELECT user, SUM(count) AS total FROM counts WHERE guild IN ({_marks(guilds)}) "
+            "AND word = ? GROUP BY user ORDER BY total DESC LIMIT ? OFFSET ?",
+            (*guilds, word, limit, offset),
+        ).fetchall()
+
+    async def top(self, guilds, word, limit, offset=0):
+        """Highest counts for `word` across `guilds`.
+
+        A single guild is read straight off the index; several are summed
+        per user first.
+        """
+        return await self._run(self._top, tuple(guilds), word, limit, offset)
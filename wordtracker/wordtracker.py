@@ -1,53 +1,205 @@
-from redbot.core import commands, Config
+import asyncio
+import logging
 import re
+import time
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+import discord
+from redbot.core import commands, Config
+from redbot.core.data_manager import cog_data_path
+from redbot.core.utils.menus import menu, DEFAULT_CONTROLS
+
+from .matcher import WordMatcher
+from .store import CountStore, hour_start
+
+log = logging.getLogger("red.dylanpatrick.wordtracker")
+
+FLUSH_INTERVAL = 60    # Seconds between write-behind flushes
+FLUSH_THRESHOLD = 500  # Pending (guild, word, user) rows that trigger an early flush
+LEGACY_GUILD = 0       # Shard for DMs and for counts from before per-guild storage
+LEADERBOARD_SIZE = 100
+PAGE_SIZE = 10
+PRUNE_INTERVAL = 3600  # Seconds between dropping expired hour/day buckets
+BACKFILL_CONCURRENCY = 3    # Channels scanned at once during a backfill
+BACKFILL_CHECKPOINT = 1000  # Messages between saved backfill checkpoints
+BACKFILL_PROGRESS = 15      # Seconds between progress updates
+
+WINDOW_RE = re.compile(r"^(\d+)\s*(h|d|w|mo|y)$")
+WINDOW_UNITS = {"h": 3600, "d": 86400, "w": 7 * 86400, "mo": 30 * 86400, "y": 365 * 86400}
+WINDOW_NAMES = {"today": "24h", "day": "24h", "week": "7d", "month": "30d", "year": "365d"}
+
+
+def parse_window(text):
+    """Seconds for a window such as `24h`, `7d`, `3mo` or `week`, else None."""
+    text = WINDOW_NAMES.get(text.lower(), text.lower())
+    match = WINDOW_RE.match(text)
+    if not match or int(match.group(1)) == 0:
+        return None
+    return int(match.group(1)) * WINDOW_UNITS[match.group(2)]
 
 class WordTracker(commands.Cog):
     """A cog to track usage counts for multiple words in chat messages (including substrings)."""
 
+    metrics_timer = staticmethod(lambda family, name: nullcontext())
+
     def __init__(self, bot):
         self.bot = bot
         self.config = Config.get_conf(self, identifier=1234567890)
         default_global = {
             "tracked_words": [],  # List of words being tracked
+            "word_added": {},     # When each word started being counted live: {word: unix time}
+            "word_start": {},     # First message counted live for each word: {word: message id}
+            "legacy_counts": False,  # Migrated counts in LEGACY_GUILD not yet given to a guild
+            # Legacy global layout, migrated into the count store on load
             "word_counts": {},    # Global counts per word
             "user_counts": {}     # Counts per word per user: {word: {user_id: count}}
         }
         self.config.register_global(**default_global)
+        self.matcher = None  # Compiled from tracked_words on load and on change
+
+        # Counts are sharded per guild in SQLite; increments are collected
+        # here and written behind in batches.
+        self.store = CountStore(
+            cog_data_path(self) / "counts.db",
+            timer=lambda family, name: self.metrics_timer(family, name),
+        )
+        self._deltas = {}  # {(guild_id, word, user_id): increment}
+        self._hours = {}   # {(guild_id, word, hour_start): increment}
+        self._last_prune = 0
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+        self._adopt_task = None
+        self._legacy = False  # Mirrors legacy_counts
+        self._backfills = {}  # {(guild_id, word): Task}
+        self._starting = set()  # Words added since the last message seen
+
+    async def cog_load(self):
+        await self.store.open()
+        await self._migrate()
+        self._legacy = await self.config.legacy_counts()
+        if self._legacy:
+            self._adopt_task = asyncio.create_task(self._adopt_legacy())
+        self._compile(await self.config.tracked_words())
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def cog_unload(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        if self._adopt_task is not None:
+            self._adopt_task.cancel()
+        for task in self._backfills.values():
+            task.cancel()
+        await self._flush()
+        await self.store.close()
+
+    async def _migrate(self):
+        # The old layout has no guild information, so it goes to LEGACY_GUILD.
+        user_counts = await self.config.user_counts()
+        if not user_counts:
+            return
+        deltas = {
+            (LEGACY_GUILD, word, int(uid)): count
+            for word, users in user_counts.items()
+            for uid, count in users.items()
+            if count
+        }
+        await self.store.add(deltas)
+        await self.config.legacy_counts.set(True)
+        await self.config.word_counts.clear()
+        await self.config.user_counts.clear()
+        log.info("Migrated %d word counts to the per-guild count store.", len(deltas))
+
+    async def _adopt_legacy(self):
+        # With a single server the old counts can only have come from it.
+        # Otherwise they stay in LEGACY_GUILD and every server shows them.
+        await self.bot.wait_until_red_ready()
+        if len(self.bot.guilds) != 1:
+            return
+        guild = self.bot.guilds[0]
+        async with self._flush_lock:
+            await self.store.move_guild(LEGACY_GUILD, guild.id)
+        self._legacy = False
+        await self.config.legacy_counts.set(False)
+        log.info("Moved migrated word counts to %s.", guild.id)
+
+    def _guilds(self, guild_id):
+        # Shards a server's totals and leaderboards are read from.
+        if guild_id != LEGACY_GUILD and self._legacy:
+            return (guild_id, LEGACY_GUILD)
+        return (guild_id,)
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self._flush()
+                now = time.time()
+                if now - self._last_prune >= PRUNE_INTERVAL:
+                    self._last_prune = now
+                    await self.store.prune(int(now))
+            except Exception:
+                log.exception("Failed to save word counts.")
+
+    async def _flush(self):
+        async with self._flush_lock:
+            deltas, self._deltas = self._deltas, {}
+            hours, self._hours = self._hours, {}
+            try:
+                await self.store.add(deltas, hours)
+            except Exception:
+                # Keep the increments for the next attempt
+                for key, count in deltas.items():
+                    self._deltas[key] = self._deltas.get(key, 0) + count
+                for key, count in hours.items():
+                    self._hours[key] = self._hours.get(key, 0) + count
+                raise
+
+    def _compile(self, tracked):
+        self.matcher = WordMatcher(w.lower() for w in tracked) if tracked else None
 
     @commands.Cog.listener()
     async def on_message(self, message):
+        if self.matcher is None:
+            return
+        if self._starting:
+            # Everything from this message on is counted live; backfills
+            # scan strictly before it.
+            await self._mark_start(message.id)
         if message.author.bot:
             return
-        content = message.content.lower()
-        tracked_words = await self.config.tracked_words()
-        if not tracked_words:
+        with self.metrics_timer("listener", "wordtracker.on_message"):
+            self._count(message)
+
+    async def _mark_start(self, message_id):
+        words, self._starting = self._starting, set()
+        async with self.config.word_start() as start:
+            for word in words:
+                start[word] = message_id
+
+    def _count(self, message):
+        # Count all occurrences of every substring in one pass (case-insensitive)
+        found = self.matcher.count(message.content.lower())
+        if not found:
             return
 
-        global_counts = await self.config.word_counts()
-        user_counts = await self.config.user_counts()
-        updated_global = False
-        updated_users = False
-
-        for word in tracked_words:
-            # Count all occurrences of the substring (case-insensitive)
-            substr = re.escape(word.lower())
-            matches = re.findall(substr, content)
-            count = len(matches)
-            if count > 0:
-                # Update global count
-                global_counts[word] = global_counts.get(word, 0) + count
-                updated_global = True
-                # Update per-user count
-                w_users = user_counts.get(word, {})
-                uid = str(message.author.id)
-                w_users[uid] = w_users.get(uid, 0) + count
-                user_counts[word] = w_users
-                updated_users = True
-
-        if updated_global:
-            await self.config.word_counts.set(global_counts)
-        if updated_users:
-            await self.config.user_counts.set(user_counts)
+        guild_id = message.guild.id if message.guild else LEGACY_GUILD
+        uid = message.author.id
+        hour = hour_start(message.created_at.timestamp())
+
+        for word, count in found.items():
+            key = (guild_id, word, uid)
+            self._deltas[key] = self._deltas.get(key, 0) + count
+            key = (guild_id, word, hour)
+            self._hours[key] = self._hours.get(key, 0) + count
+
+        if len(self._deltas) >= FLUSH_THRESHOLD:
+            self._wake.set()
 
     @commands.command()
     async def addword(self, ctx, *, word: str):
@@ -59,13 +211,14 @@ class WordTracker(commands.Cog):
             return
         tracked.append(word)
         await self.config.tracked_words.set(tracked)
-        # Initialize counts
-        global_counts = await self.config.word_counts()
-        user_counts = await self.config.user_counts()
-        global_counts.setdefault(word, 0)
-        user_counts.setdefault(word, {})
-        await self.config.word_counts.set(global_counts)
-        await self.config.user_counts.set(user_counts)
+        # Record the cutoff before matching starts, so no message is both
+        # counted live and scanned by a backfill.
+        async with self.config.word_added() as added:
+            added[word] = time.time()
+        async with self.config.word_start() as start:
+            start.pop(word, None)
+        self._starting.add(word)
+        self._compile(tracked)
         await ctx.send(f"Now tracking substring: '{word}'")
 
     @commands.command()
@@ -78,12 +231,19 @@ class WordTracker(commands.Cog):
             return
         tracked.remove(word)
         await self.config.tracked_words.set(tracked)
-        global_counts = await self.config.word_counts()
-        user_counts = await self.config.user_counts()
-        global_counts.pop(word, None)
-        user_counts.pop(word, None)
-        await self.config.word_counts.set(global_counts)
-        await self.config.user_counts.set(user_counts)
+        self._compile(tracked)
+        for (guild_id, w), task in list(self._backfills.items()):
+            if w == word:
+                task.cancel()
+        self._starting.discard(word)
+        async with self.config.word_added() as added:
+            added.pop(word, None)
+        async with self.config.word_start() as start:
+            start.pop(word, None)
+        async with self._flush_lock:
+            self._deltas = {k: v for k, v in self._deltas.items() if k[1] != word}
+            self._hours = {k: v for k, v in self._hours.items() if k[1] != word}
+            await self.store.remove_word(word)
         await ctx.send(f"Stopped tracking substring: '{word}'")
 
     @commands.command()
@@ -97,32 +257,206 @@ class WordTracker(commands.Cog):
 
     @commands.command()
     async def wordcount(self, ctx, *, word: str = None):
-        """Displays counts for a specific substring or all substrings if none specified."""
+        """Displays counts for a specific substring or all substrings if none specified.
+
+        Start with a window such as `24h`, `7d`, `3mo` or `week` to only
+        count that recent period, e.g. `wordcount 7d hello`. Counts from
+        before per-server tracking are included in every server's totals.
+        """
         tracked = await self.config.tracked_words()
-        global_counts = await self.config.word_counts()
-        user_counts = await self.config.user_counts()
+        guild_id = ctx.guild.id if ctx.guild else LEGACY_GUILD
+        # Apply pending increments so the numbers are current
+        await self._flush()
+
+        window, label = None, None
+        if word and word.lower() not in tracked:
+            label, _, rest = word.partition(" ")
+            window = parse_window(label)
+            if window is not None:
+                word = rest.strip() or None
+
+        if window is not None:
+            await self._send_window(ctx, guild_id, tracked, word, window, label)
+            return
 
         if word:
             word = word.lower()
             if word not in tracked:
                 await ctx.send(f"'{word}' is not being tracked.")
                 return
-            total = global_counts.get(word, 0)
-            users = user_counts.get(word, {})
-            lines = [f"'{word}' total mentions: {total}"]
-            if users:
-                sorted_users = sorted(users.items(), key=lambda x: x[1], reverse=True)
-                lines += [f"User <@{uid}>: {cnt}" for uid, cnt in sorted_users]
-            await ctx.send("\n".join(lines))
+            total = await self.store.total(self._guilds(guild_id), word)
+            overall = await self.store.global_total(word)
+            header = f"'{word}' total mentions: {total}"
+            if overall != total:
+                header += f" ({overall} across all servers)"
+
+            rows = await self.store.top(self._guilds(guild_id), word, LEADERBOARD_SIZE)
+            if not rows:
+                await ctx.send(header)
+                return
+
+            page_count = -(-len(rows) // PAGE_SIZE)
+            pages = []
+            for number, start in enumerate(range(0, len(rows), PAGE_SIZE), 1):
+                lines = [header]
+                lines += [f"User <@{uid}>: {cnt}" for uid, cnt in rows[start:start + PAGE_SIZE]]
+                if page_count > 1:
+                    lines.append(f"Page {number}/{page_count}")
+                pages.append("\n".join(lines))
+
+            if len(pages) == 1:
+                await ctx.send(pages[0])
+            else:
+                await menu(ctx, pages, DEFAULT_CONTROLS)
         else:
             if not tracked:
                 await ctx.send("No substrings are currently being tracked.")
                 return
+            totals = await self.store.totals(self._guilds(guild_id))
             lines = []
             for w in tracked:
-                total = global_counts.get(w, 0)
+                total = totals.get(w, 0)
                 lines.append(f"'{w}': {total} mentions")
             await ctx.send("\n".join(lines))
 
+    @commands.command()
+    @commands.guild_only()
+    @commands.admin_or_permissions(manage_guild=True)
+    async def backfillwords(self, ctx, channels: commands.Greedy[discord.TextChannel], *, word: str):
+        """Counts past uses of a tracked substring in the given channels (default: this one).
+
+        Only messages sent before the word was added are scanned, so nothing
+        is counted twice. Run the same command again to resume an
+        interrupted backfill.
+        """
+        word = word.lower()
+        if word not in await self.config.tracked_words():
+            await ctx.send(f"'{word}' is not being tracked.")
+            return
+        added = (await self.config.word_added()).get(word)
+        if added is None:
+            await ctx.send(
+                f"'{word}' was tracked before add times were recorded, "
+                "so a backfill could count messages twice."
+            )
+            return
+        key = (ctx.guild.id, word)
+        if key in self._backfills:
+            await ctx.send(f"A backfill for '{word}' is already running.")
+            return
+
+        # Prefer the first live-counted message as the boundary; the add
+        # time only covers words no message has been seen for yet.
+        start = (await self.config.word_start()).get(word)
+        if start is not None:
+            cutoff = discord.Object(id=start)
+        else:
+            cutoff = datetime.fromtimestamp(added, timezone.utc)
+
+        task = asyncio.create_task(self._backfill(ctx, word, cutoff, channels or [ctx.channel]))
+        self._backfills[key] = task
+        try:
+            await task
+        except asyncio.CancelledError:
+            await ctx.send(f"Backfill for '{word}' stopped; run it again to resume.")
+        finally:
+            self._backfills.pop(key, None)
+
+    async def _backfill(self, ctx, word, cutoff, channels):
+        matcher = WordMatcher([word])
+        stats = {"messages": 0, "found": 0}
+        semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+        started = time.monotonic()
+
+        async def run(channel):
+            async with semaphore:
+                await self._backfill_channel(channel, word, matcher, cutoff, stats)
+
+        def progress():
+            elapsed = max(time.monotonic() - started, 1e-6)
+            return (
+                f"{stats['messages']} messages scanned, {stats['found']} uses found "
+                f"({stats['messages'] / elapsed:.0f} msg/s)"
+            )
+
+        status = await ctx.send(f"Backfilling '{word}' in {len(channels)} channel(s)...")
+        runs = asyncio.gather(*(run(c) for c in channels), return_exceptions=True)
+        try:
+            while True:
+                done, _ = await asyncio.wait({runs}, timeout=BACKFILL_PROGRESS)
+                if done:
+                    break
+                try:
+                    await status.edit(content=f"Backfilling '{word}': {progress()}")
+                except discord.HTTPException:
+                    pass
+        except asyncio.CancelledError:
+            runs.cancel()
+            raise
+
+        results = runs.result()
+        failed = [c.mention for c, r in zip(channels, results) if isinstance(r, Exception)]
+        for channel, result in zip(channels, results):
+            if isinstance(result, Exception) and not isinstance(result, discord.Forbidden):
+                log.error("Backfill of %s failed.", channel.id, exc_info=result)
+
+        lines = [f"Backfill for '{word}' finished: {progress()}."]
+        if failed:
+            lines.append("Could not read: " + ", ".join(failed))
+        await ctx.send("\n".join(lines))
+
+    async def _backfill_channel(self, channel, word, matcher, cutoff, stats):
+        before_id, done = await self.store.backfill_state(word, channel.id)
+        if done:
+            return
+        before = discord.Object(id=before_id) if before_id else cutoff
+
+        guild_id = channel.guild.id
+        deltas, hours = {}, {}
+        scanned, last_id = 0, None
+
+        async for message in channel.history(limit=None, before=before):
+            scanned += 1
+            last_id = message.id
+            stats["messages"] += 1
+            if not message.author.bot:
+                # Same matching as on_message
+                found = matcher.count(message.content.lower())
+                hour = hour_start(message.created_at.timestamp())
+                for w, count in found.items():
+                    key = (guild_id, w, message.author.id)
+                    deltas[key] = deltas.get(key, 0) + count
+                    key = (guild_id, w, hour)
+                    hours[key] = hours.get(key, 0) + count
+                    stats["found"] += count
+
+            if scanned >= BACKFILL_CHECKPOINT:
+                # Counts and checkpoint commit together, so a resume never
+                # re-counts or skips a batch.
+                await self.store.add(deltas, hours, (word, channel.id, last_id, False))
+                before_id = last_id
+                deltas, hours = {}, {}
+                scanned = 0
+
+        await self.store.add(deltas, hours, (word, channel.id, last_id or before_id, True))
+
+    async def _send_window(self, ctx, guild_id, tracked, word, window, label):
+        totals = await self.store.window_totals(guild_id, window, int(time.time()))
+        if word:
+            word = word.lower()
+            if word not in tracked:
+                await ctx.send(f"'{word}' is not being tracked.")
+                return
+            await ctx.send(f"'{word}' mentions in the last {label}: {totals.get(word, 0)}")
+            return
+
+        if not tracked:
+            await ctx.send("No substrings are currently being tracked.")
+            return
+        lines = [f"Mentions in the last {label}:"]
+        for w in tracked:
+            lines.append(f"'{w}': {totals.get(w, 0)} mentions")
+        await ctx.send("\n".join(lines))
+
 async def setup(bot):
     await bot.add_cog(WordTracker(bot))
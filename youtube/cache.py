@@ -0,0 +1,107 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+def normalize(query):
+    return " ".join(query.split()).casefold()
+
+
+class SearchCache:
+    """TTL + LRU cache of search results keyed on the normalized query.
+
+    A cached search for more results than asked for answers the smaller
+    request too, and so does one that came back with fewer results than
+    it asked for (there is nothing more to find). Identical searches that
+    arrive while one is running wait for it instead of starting another.
+    Empty results are never cached.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self.hits = 0
+        self.shared = 0
+        self.misses = 0
+        self.miss_time = 0.0  # seconds spent in factory() across misses
+        self.total_time = 0.0  # seconds spent answering every lookup
+
+        self._entries = OrderedDict()  # query -> (expires_at, limit, results)
+        self._inflight = {}  # query -> {limit: future}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, query, limit):
+        item = self._entries.get(query)
+        if item is None:
+            return None
+
+        expires_at, cached_limit, results = item
+        if expires_at < time.monotonic():
+            del self._entries[query]
+            return None
+        if cached_limit < limit and len(results) == cached_limit:
+            return None
+
+        self._entries.move_to_end(query)
+        return results[:limit]
+
+    def _put(self, query, limit, results):
+        item = self._entries.pop(query, None)
+        if item is not None and item[1] > limit and item[0] >= time.monotonic():
+            # Keep the bigger result set we already have.
+            self._entries[query] = item
+            return
+        self._entries[query] = (time.monotonic() + self.ttl, limit, results)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _joinable(self, query, limit):
+        for running_limit, future in self._inflight.get(query, {}).items():
+            if running_limit >= limit:
+                return future
+        return None
+
+    async def fetch(self, query, limit, factory):
+        """Results for `query`, calling ``factory(query, limit)`` only on a miss."""
+        start = time.monotonic()
+        try:
+            return await self._fetch(normalize(query), limit, factory)
+        finally:
+            self.total_time += time.monotonic() - start
+
+    async def _fetch(self, query, limit, factory):
+        results = self._get(query, limit)
+        if results is not None:
+            self.hits += 1
+            return results
+
+        future = self._joinable(query, limit)
+        if future is not None:
+            self.shared += 1
+            return (await asyncio.shield(future))[:limit]
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        running = self._inflight.setdefault(query, {})
+        running[limit] = future
+        start = time.monotonic()
+        try:
+            results = await factory(query, limit)
+        except BaseException as e:
+            future.set_exception(e)
+            # Only waiters should see the error; don't warn if there were none.
+            future.exception()
+            raise
+        else:
+            future.set_result(results)
+            if results:
+                self._put(query, limit, results)
+            return results
+        finally:
+            self.miss_time += time.monotonic() - start
+            del running[limit]
+            if not running:
+                self._inflight.pop(query, None)
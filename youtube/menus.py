@@ -0,0 +1,121 @@
+import discord
+
+
+class SearchFailed(Exception):
+    """A search could not be run; the message is the reply for the user."""
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "Live"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02}:{seconds:02}"
+    return f"{minutes}:{seconds:02}"
+
+
+def result_embeds(results, offset, colour):
+    embeds = []
+    for number, result in enumerate(results, offset + 1):
+        details = format_duration(result["duration"])
+        if result["channel"]:
+            details = f"{result['channel']} • {details}"
+        embeds.append(discord.Embed(
+            title=f"{number}. {result['title']}"[:256],
+            url=result["url"],
+            description=details,
+            colour=colour,
+        ))
+    return embeds
+
+
+class SearchPages(discord.ui.View):
+    """Paginated search results that only search further when paged forward.
+
+    Each page re-runs the search with a larger limit. The cog's cache
+    answers pages that are already known, so paging back is free.
+    """
+
+    def __init__(self, cog, ctx, query, results, per_page, max_results, timeout=180):
+        super().__init__(timeout=timeout)
+        self.cog = cog
+        self.ctx = ctx
+        self.query = query
+        self.results = results
+        self.per_page = per_page
+        self.max_results = max_results
+        self.exhausted = len(results) < per_page or per_page >= max_results
+        self.page = 0
+        self.message = None
+        self.colour = None
+
+    @property
+    def last_page(self):
+        """Index of the last page if the end of the results is known, else None."""
+        if not self.exhausted:
+            return None
+        return max(0, (len(self.results) - 1) // self.per_page)
+
+    async def _load(self, page):
+        end = min((page + 1) * self.per_page, self.max_results)
+        if len(self.results) < end and not self.exhausted:
+            self.results = await self.cog._youtube_results(self.query, end)
+            self.exhausted = len(self.results) < end or end >= self.max_results
+        return self.results[page * self.per_page:end]
+
+    def _render(self, entries):
+        embeds = result_embeds(entries, self.page * self.per_page, self.colour)
+        total = f"/{self.last_page + 1}" if self.exhausted else ""
+        embeds[-1].set_footer(text=f"Page {self.page + 1}{total} • {self.query}"[:2048])
+
+        self.previous.disabled = self.page == 0
+        self.next.disabled = self.last_page is not None and self.page >= self.last_page
+        return embeds
+
+    async def start(self):
+        self.colour = await self.ctx.embed_colour()
+        embeds = self._render(self.results[:self.per_page])
+        if self.last_page == 0:
+            self.stop()
+            self.message = await self.ctx.send(embeds=embeds)
+        else:
+            self.message = await self.ctx.send(embeds=embeds, view=self)
+
+    async def _show(self, interaction, page):
+        await interaction.response.defer()
+        try:
+            entries = await self._load(page)
+        except SearchFailed as e:
+            return await interaction.followup.send(str(e), ephemeral=True)
+        if not entries:
+            # The results ran out exactly at the previous page.
+            return await interaction.edit_original_response(
+                embeds=self._render(await self._load(self.page)), view=self
+            )
+        self.page = page
+        await interaction.edit_original_response(embeds=self._render(entries), view=self)
+
+    async def interaction_check(self, interaction):
+        return interaction.user.id == self.ctx.author.id
+
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+    @discord.ui.button(emoji="\N{BLACK LEFT-POINTING TRIANGLE}", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction, button):
+        await self._show(interaction, max(0, self.page - 1))
+
+    @discord.ui.button(emoji="\N{BLACK RIGHT-POINTING TRIANGLE}", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction, button):
+        await self._show(interaction, self.page + 1)
+
+    @discord.ui.button(emoji="\N{CROSS MARK}", style=discord.ButtonStyle.secondary)
+    async def close(self, interaction, button):
+        self.stop()
+        await interaction.response.defer()
+        await interaction.message.delete()
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import site
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List
+
+log = logging.getLogger("red.dylanpatrick.youtube")
+
+YDL_OPTS = {
+    "quiet": True,
+    "no_warnings": True,
+    "skip_download": True,
+    "extract_flat": True,
+    "default_search": "ytsearch",
+}
+
+# One YoutubeDL per worker, created on its first search. In the process
+# pool every worker is its own process, so this is per process there.
+_local = threading.local()
+
+
+def _extractor():
+    ydl = getattr(_local, "ydl", None)
+    if ydl is None:
+        from yt_dlp import YoutubeDL
+
+        ydl = _local.ydl = YoutubeDL(YDL_OPTS)
+    return ydl
+
+
+def search(query: str, limit: int) -> List[dict]:
+    """Runs in a worker: the top `limit` videos for `query`.
+
+    Each result has the video's url, title, channel and duration (in
+    seconds, None for live streams), all from the flat search results.
+    """
+    info = _extractor().extract_info(f"ytsearch{limit}:{query}", download=False)
+    entries = info.get("entries", []) if isinstance(info, dict) else []
+
+    results: List[dict] = []
+    seen = set()
+
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+
+        video_id = entry.get("id")
+        webpage_url = entry.get("url") or entry.get("webpage_url")
+        ie_key = entry.get("ie_key")
+
+        if video_id and ie_key in {"Youtube", "YoutubeTab"}:
+            url = f"https://www.youtube.com/watch?v={video_id}"
+        elif video_id and not webpage_url:
+            url = f"https://www.youtube.com/watch?v={video_id}"
+        elif isinstance(webpage_url, str) and "youtube.com/watch" in webpage_url:
+            url = webpage_url
+        elif isinstance(webpage_url, str) and "youtu.be/" in webpage_url:
+            url = webpage_url
+        else:
+            continue
+
+        if url not in seen:
+            seen.add(url)
+            results.append({
+                "url": url,
+                "title": entry.get("title") or url,
+                "channel": entry.get("channel") or entry.get("uploader"),
+                "duration": entry.get("duration"),
+            })
+
+    return results
+
+
+class PoolBusy(Exception):
+    """Raised instead of queueing a search when the pool is full."""
+
+
+class ExtractorPool:
+    """Bounded pool that runs yt-dlp extractions off the bot's default executor.
+
+    Extraction is CPU-heavy Python, so by default it runs in worker
+    processes and does not hold the bot's GIL. If processes cannot be
+    started, or the pool breaks, it falls back to a dedicated thread pool.
+    At most `workers + queue_limit` searches are running or waiting at
+    once; beyond that `run` raises PoolBusy.
+    """
+
+    def __init__(self, workers, queue_limit, processes=True):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.processes = processes
+        self.pending = 0
+        self._executor = None
+
+    def _start(self):
+        if self.processes:
+            try:
+                # Spawned workers import this module by name, so make sure
+                # the directory holding the cog package is on their path.
+                cog_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+                return ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=site.addsitedir,
+                    initargs=(cog_root,),
+                )
+            except (OSError, NotImplementedError, ValueError):
+                log.warning("Could not start extraction processes; using threads.", exc_info=True)
+                self.processes = False
+        return ThreadPoolExecutor(self.workers, thread_name_prefix="youtube")
+
+    async def run(self, fn, *args):
+        if self.pending >= self.workers + self.queue_limit:
+            raise PoolBusy()
+
+        self.pending += 1
+        try:
+            if self._executor is None:
+                self._executor = self._start()
+            executor = self._executor
+            try:
+                return await asyncio.wrap_future(executor.submit(fn, *args))
+            except BrokenProcessPool:
+                # Every search waiting on the broken pool lands here; only
+                # the first one replaces it.
+                if self._executor is executor:
+                    log.warning("Extraction process pool broke; falling back to threads.", exc_info=True)
+                    self.close()
+                    self.processes = False
+                    self._executor = self._start()
+                return await asyncio.wrap_future(self._executor.submit(fn, *args))
+        finally:
+            self.pending -= 1
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
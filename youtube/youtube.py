@@ -1,97 +1,103 @@
-import asyncio
+import importlib.util
+from contextlib import nullcontext
 from typing import List
 
 from redbot.core import commands
-from redbot.core.utils.menus import menu, DEFAULT_CONTROLS
 
-try:
-    from yt_dlp import YoutubeDL
-except ImportError:
-    YoutubeDL = None
+from . import worker
+from .cache import SearchCache
+from .menus import SearchFailed, SearchPages
+from .worker import ExtractorPool, PoolBusy
+
+CACHE_SIZE = 256  # Distinct queries kept
+CACHE_TTL = 600  # Seconds a search result stays cached
+WORKERS = 2  # Extraction worker processes
+QUEUE_LIMIT = 8  # Searches allowed to wait for a worker before replying busy
+PAGE_SIZE = 5  # Results per ytsearch page, also the size of the first search
+MAX_RESULTS = 50  # ytsearch stops paging after this many results
 
 
 class YouTube(commands.Cog):
     """Search YouTube for videos."""
 
+    metrics_timer = staticmethod(lambda family, name: nullcontext())
+
     def __init__(self, bot):
         self.bot = bot
+        self.cache = SearchCache(CACHE_SIZE, CACHE_TTL)
+        self.pool = ExtractorPool(WORKERS, QUEUE_LIMIT)
+        # yt_dlp itself is only imported by the workers, on first search.
+        self.have_ytdlp = importlib.util.find_spec("yt_dlp") is not None
+
+    async def cog_unload(self):
+        self.pool.close()
 
     async def red_delete_data_for_user(self, **kwargs):
         return
 
-    async def _youtube_results(self, query: str, limit: int = 10) -> List[str]:
-        if YoutubeDL is None:
-            return [
+    async def _youtube_results(self, query: str, limit: int = 10) -> List[dict]:
+        """Top `limit` results for `query`; raises SearchFailed with a reply on errors."""
+        if not self.have_ytdlp:
+            raise SearchFailed(
                 "yt-dlp is not installed. Install it with: `pip install -U yt-dlp`"
-            ]
-
-        loop = asyncio.get_running_loop()
-
-        def do_search() -> List[str]:
-            ydl_opts = {
-                "quiet": True,
-                "no_warnings": True,
-                "skip_download": True,
-                "extract_flat": True,
-                "default_search": "ytsearch",
-            }
-
-            results: List[str] = []
-            seen = set()
-
-            with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(f"ytsearch{limit}:{query}", download=False)
-
-            entries = info.get("entries", []) if isinstance(info, dict) else []
-
-            for entry in entries:
-                if not isinstance(entry, dict):
-                    continue
-
-                video_id = entry.get("id")
-                webpage_url = entry.get("url") or entry.get("webpage_url")
-                ie_key = entry.get("ie_key")
-
-                if video_id and ie_key in {"Youtube", "YoutubeTab"}:
-                    url = f"https://www.youtube.com/watch?v={video_id}"
-                elif video_id and not webpage_url:
-                    url = f"https://www.youtube.com/watch?v={video_id}"
-                elif isinstance(webpage_url, str) and "youtube.com/watch" in webpage_url:
-                    url = webpage_url
-                elif isinstance(webpage_url, str) and "youtu.be/" in webpage_url:
-                    url = webpage_url
-                else:
-                    continue
-
-                if url not in seen:
-                    seen.add(url)
-                    results.append(url)
-
-            return results
+            )
 
         try:
-            return await loop.run_in_executor(None, do_search)
+            return await self.cache.fetch(query, limit, self._extract)
+        except PoolBusy:
+            raise SearchFailed("I'm handling too many searches right now. Try again in a moment.")
         except Exception as e:
-            return [f"Something went terribly wrong! [{type(e).__name__}: {e}]"]
+            raise SearchFailed(f"Something went terribly wrong! [{type(e).__name__}: {e}]")
+
+    async def _extract(self, query: str, limit: int) -> List[dict]:
+        with self.metrics_timer("outbound", "youtube.extract"):
+            return await self.pool.run(worker.search, query, limit)
 
     @commands.command()
     async def youtube(self, ctx, *, query: str):
         """Search YouTube and return the top result."""
-        async with ctx.typing():
-            result = await self._youtube_results(query, limit=5)
+        try:
+            async with ctx.typing():
+                result = await self._youtube_results(query, limit=5)
+        except SearchFailed as e:
+            return await ctx.send(str(e))
 
         if result:
-            await ctx.send(result[0])
+            await ctx.send(result[0]["url"])
         else:
             await ctx.send("Nothing found. Try again later.")
 
     @commands.command()
     async def ytsearch(self, ctx, *, query: str):
         """Search YouTube and show multiple results."""
-        async with ctx.typing():
-            result = await self._youtube_results(query, limit=10)
+        # Only the first page is searched up front; the view searches
+        # further as the user pages forward.
+        try:
+            async with ctx.typing():
+                result = await self._youtube_results(query, limit=PAGE_SIZE)
+        except SearchFailed as e:
+            return await ctx.send(str(e))
 
         if result:
-            await menu(ctx, result, DEFAULT_CONTROLS)
+            await SearchPages(self, ctx, query, result, PAGE_SIZE, MAX_RESULTS).start()
         else:
             await ctx.send("Nothing found. Try again later.")
+
+    @commands.command()
+    @commands.is_owner()
+    async def ytcachestats(self, ctx):
+        """Show how often searches are answered from the cache."""
+        cache = self.cache
+        lookups = cache.hits + cache.shared + cache.misses
+        if not lookups:
+            return await ctx.send("No searches yet.")
+
+        ratio = (cache.hits + cache.shared) / lookups
+        miss_avg = cache.miss_time / cache.misses if cache.misses else 0.0
+        await ctx.send(
+            f"{len(cache)} queries cached, {cache.hits} hits, "
+            f"{cache.shared} shared in-flight, {cache.misses} misses "
+            f"({ratio:.1%} served without a new search).\n"
+            f"Average latency: {cache.total_time / lookups * 1000:.0f} ms overall, "
+            f"{miss_avg * 1000:.0f} ms per search."
+        )